@@ -0,0 +1,155 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+import CelesteUtils as utils
+from ExampleSearcheline100 import Search100
+from ExampleSearcheline2100 import Search2100
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+'''
+Emulator and solver benchmarks
+
+  > python Benchmark.py --output results.json
+    - measures PICO8.step throughput (frames/s) on all 31 rooms, and the example search problems (nodes/s, time to first solution)
+    - every benchmark runs in a fresh process, so peak RSS is reported per benchmark
+  > python Benchmark.py --baseline results.json
+    - compare against an earlier run, exiting with an error if any benchmark regressed by more than --threshold (default 10%)
+'''
+
+# search benchmarks: name -> (search problem, search method, arguments)
+searches = {
+  '2100m iddfs': (Search2100, 'search', (40,)),
+  '2100m bfs': (Search2100, 'search_bfs', (40,)),
+  '100m iddfs depth 30': (Search100, 'search', (30,)),
+  '100m astar w3': (Search100, 'search_astar', (50, 3.0)),
+}
+
+# metrics compared against a baseline, and whether higher values are better
+metrics = {
+  'frames_per_sec': True,
+  'nodes_per_sec': True,
+  'time_to_first_solution': False,
+  'peak_rss_kb': False,
+}
+
+def peak_rss_kb():
+  try:
+    import resource
+  except ImportError:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # bytes on macOS, kilobytes elsewhere
+  return rss // 1024 if sys.platform == 'darwin' else rss
+
+# step a room with a fixed pseudo-random input sequence, in loop mode
+def bench_room(level_id, frames):
+  rng = random.Random(level_id)
+  inputs = [rng.choice([0, 1, 2, 16, 18, 34, 36, 38]) for _ in range(frames)]
+  p8 = PICO8(Celeste)
+  utils.enable_loop_mode(p8)
+  utils.load_room(p8, level_id)
+  timer = time.perf_counter()
+  for a in inputs:
+    p8.set_btn_state(a)
+    p8.step()
+  elapsed = time.perf_counter() - timer
+  return {'frames': frames, 'elapsed': elapsed, 'frames_per_sec': frames / elapsed, 'peak_rss_kb': peak_rss_kb()}
+
+# run a search problem, counting transitions as nodes and timing the first solution
+def bench_search(name):
+  cls, method, args = searches[name]
+
+  class Benchmarked(cls):
+    def transition(self, state, a):
+      self.nodes += 1
+      return super().transition(state, a)
+
+    def add_solution(self, inputs):
+      if self.first_solution == None:
+        self.first_solution = time.perf_counter() - self.timer
+      super().add_solution(inputs)
+
+  s = Benchmarked()
+  s.nodes, s.first_solution = 0, None
+  s.timer = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    solutions = getattr(s, method)(*args)
+  elapsed = time.perf_counter() - s.timer
+  return {
+    'nodes': s.nodes,
+    'elapsed': elapsed,
+    'nodes_per_sec': s.nodes / elapsed,
+    'time_to_first_solution': s.first_solution,
+    'solution_frames': len(solutions[0]) - 1 if solutions else None,
+    'peak_rss_kb': peak_rss_kb()
+  }
+
+# run a benchmark in a fresh process
+def run_isolated(f, *args):
+  with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+    return pool.apply(f, args)
+
+def run(frames, rooms=True, search=True):
+  results = {}
+  if rooms:
+    for level_id in range(31):
+      results[f'room {level_id}'] = run_isolated(bench_room, level_id, frames)
+      print(f"room {level_id:2d}: {results[f'room {level_id}']['frames_per_sec']:9.0f} frames/s")
+  if search:
+    for name in searches:
+      r = results[name] = run_isolated(bench_search, name)
+      first = f"{r['time_to_first_solution']:.2f} [s]" if r['time_to_first_solution'] != None else '-'
+      print(f"{name}: {r['nodes_per_sec']:9.0f} nodes/s, {r['nodes']} nodes, first solution: {first}, {r['elapsed']:.2f} [s]")
+  return results
+
+# list benchmarks that got worse than the baseline by more than the threshold (fraction)
+def regressions(results, baseline, threshold):
+  found = []
+  for name, r in results.items():
+    for metric, higher_is_better in metrics.items():
+      new, old = r.get(metric), baseline.get(name, {}).get(metric)
+      if new == None or old == None or old == 0:
+        continue
+      change = (new - old) / old
+      if (change < -threshold) if higher_is_better else (change > threshold):
+        found.append(f'{name} {metric}: {old:.4g} -> {new:.4g} ({100 * change:+.1f}%)')
+  return found
+
+# commit of the checkout this file is in (whatever the working directory)
+def git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+      capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Pyleste emulator and Searcheline benchmarks')
+  parser.add_argument('--output', help='write results to this JSON file')
+  parser.add_argument('--baseline', help='compare against results in this JSON file')
+  parser.add_argument('--threshold', type=float, default=0.1, help='allowed regression as a fraction (default 0.1)')
+  parser.add_argument('--frames', type=int, default=3000, help='frames stepped per room (default 3000)')
+  parser.add_argument('--rooms-only', action='store_true', help='only run the room stepping benchmarks')
+  parser.add_argument('--search-only', action='store_true', help='only run the search benchmarks')
+  args = parser.parse_args()
+
+  results = run(args.frames, rooms=not args.search_only, search=not args.rooms_only)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'commit': git_commit(), 'time': time.time(), 'results': results}, f, indent=2)
+  if args.baseline:
+    with open(args.baseline) as f:
+      found = regressions(results, json.load(f)['results'], args.threshold)
+    for r in found:
+      print(f'regression: {r}')
+    if found:
+      sys.exit(1)
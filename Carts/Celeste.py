@@ -1,21 +1,69 @@
+import copy
+import hashlib
 import math
 
 class Vector():
+  __slots__ = ('x', 'y')
+
   def __init__(self, x, y):
     self.x = x
     self.y = y
 
 class Rect():
+  __slots__ = ('x', 'y', 'w', 'h')
+
   def __init__(self, x, y, w, h):
     self.x = x
     self.y = y
     self.w = w
     self.h = h
 
+# [change] object list of a game, keeping the game's type registry in sync when it's edited in place (e.g., objects.remove(o))
+# appended objects are registered directly, other edits rebuild the registry
+# the game's own edits go through the plain list methods, updating the registry incrementally instead
+# copies and pickles are plain lists
+class ObjectList(list):
+  __slots__ = ('game',)
+
+  def __init__(self, game, objs=()):
+    super().__init__(objs)
+    self.game = game
+
+  # the game whose current object list this is (None while being built, e.g., by pickle, or once replaced)
+  def owner(self):
+    game = getattr(self, 'game', None)
+    return game if game != None and getattr(game, '_objects', None) is self else None
+
+  def append(self, o):
+    list.append(self, o)
+    game = self.owner()
+    if game != None:
+      game.register_object(o)
+
+  def __reduce_ex__(self, protocol):
+    return (list, (list(self),))
+
+  def __deepcopy__(self, memo):
+    return copy.deepcopy(list(self), memo)
+
+def _synced(name):
+  edit = getattr(list, name)
+  def synced_edit(self, *args, **kwargs):
+    result = edit(self, *args, **kwargs)
+    game = self.owner()
+    if game != None:
+      game.index_objects()
+    return result
+  synced_edit.__name__ = name
+  return synced_edit
+
+for _name in ('extend', 'insert', 'remove', 'pop', 'clear', 'sort', 'reverse', '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+  setattr(ObjectList, _name, _synced(_name))
+
 class Celeste():
   def __init__(self, pico8):
-    global p8, g
-    p8, g = pico8, self
+    # [change] objects reach the game (and console) through their owning instance instead of globals
+    self.p8 = pico8
 
     # game globals
     self.room = Vector(0, 0)
@@ -23,6 +71,7 @@ class Celeste():
     self.freeze = 0
     self.delay_restart = 0
     self.next_rm = False # [change] decouple next room from object loop
+    self.tile_masks = {} # [change] per-room tile bitmaps for collision queries
 
     self.max_djump = 1
 
@@ -70,10 +119,16 @@ class Celeste():
       if self.delay_restart == 0:
         self.load_room(self.room.x, self.room.y)
 
-    for o in self.objects:
-      o.move(o.spd.x, o.spd.y)
-      if callable(getattr(o, 'update', None)):
-        o.update()
+    # [change] fast path when the player is the only object
+    if self.player_only:
+      p = self.objects[0]
+      p.move(p.spd.x, p.spd.y)
+      p.update()
+    else:
+      for o in self.objects:
+        o.move(o.spd.x, o.spd.y)
+        if callable(getattr(o, 'update', None)):
+          o.update()
 
     # [change] decouple next room from object loop
     if self.next_rm:
@@ -89,7 +144,8 @@ class Celeste():
             o.update()
     
     # [change] remove destroyed objects after update calls
-    while self.objects.count(None) > 0: self.objects.remove(None)
+    if self.destroyed > 0:
+      self.compact_objects()
 
   # main draw loop (not actually for drawing)
 
@@ -97,6 +153,11 @@ class Celeste():
     if self.freeze > 0:
       return
 
+    # [change] fast path when the player is the only object
+    if self.player_only:
+      self.objects[0].draw()
+      return
+
     for o in self.objects:
       if callable(getattr(o, 'draw', None)):
         o.draw()
@@ -122,14 +183,23 @@ class Celeste():
     self.room.y = y
     for tx in range(16):
       for ty in range(16):
-        tile = p8.mget(self.room.x * 16 + tx, self.room.y * 16 + ty)
+        tile = self.p8.mget(self.room.x * 16 + tx, self.room.y * 16 + ty)
         if tile in self.tiles:
           self.init_object(self.tiles[tile], tx * 8, ty * 8, tile)
 
   # object base class
 
   class base_obj():
-    def __init__(self, x, y, tile=None):
+    # [change] objects use __slots__ (subclasses declare their extra fields) to keep many states compact in memory
+    __slots__ = ('g', 'collideable', 'solids', 'spr', 'flip', 'x', 'y', 'hitbox', 'spd', 'rem')
+
+    # extra fields included in state snapshots (besides position, speed, etc.)
+    state_fields = ()
+    # objects of static types never move or resize, so they can be found through a tile occupancy bitmap
+    static = False
+
+    def __init__(self, g, x, y, tile=None):
+      self.g = g
       self.collideable = True,
       self.solids = False
       self.spr = tile
@@ -141,18 +211,38 @@ class Celeste():
       self.rem = Vector(0.0, 0.0)
 
     def is_solid(self, ox, oy):
+      g = self.g
+      # [change] only terrain can be solid when the player is the only object
+      if g.player_only:
+        return g.tile_flag_at(self.x + self.hitbox.x + ox, self.y + self.hitbox.y + oy, self.hitbox.w, self.hitbox.h, 0)
       if oy > 0 and not self.check(g.platform, ox, 0) and self.check(g.platform, ox, oy):
         return True
       return g.tile_flag_at(self.x + self.hitbox.x + ox, self.y + self.hitbox.y + oy, self.hitbox.w, self.hitbox.h, 0)\
         or self.check(g.fall_floor, ox, oy)\
         or self.check(g.fake_wall, ox, oy)
 
+    # is_solid at several (ox, oy) offsets at once, returned as a list of bools
+    def probe_solid(self, offsets):
+      g = self.g
+      if g.player_only:
+        solid = g.room_masks()[0]
+        x, y, w, h = self.x + self.hitbox.x, self.y + self.hitbox.y, self.hitbox.w, self.hitbox.h
+        return [g.tile_mask(x + ox, y + oy, w, h) & solid != 0 for ox, oy in offsets]
+      return [self.is_solid(ox, oy) for ox, oy in offsets]
+
     def is_ice(self, ox, oy):
+      g = self.g
       return g.tile_flag_at(self.x + self.hitbox.x + ox, self.y + self.hitbox.y + oy, self.hitbox.w, self.hitbox.h, 4)
 
     def check(self, obj, ox, oy):
-      for other in g.objects:
-        if type(other) == obj and other != self and other.collideable and \
+      g = self.g
+      # [change] only scan objects of the requested type, skip the scan if no static object is nearby
+      if obj.static:
+        occupancy = g.type_occupancy.get(obj)
+        if not occupancy or not occupancy & g.area_mask(self.x + self.hitbox.x + ox, self.y + self.hitbox.y + oy, self.hitbox.w, self.hitbox.h):
+          return None
+      for other in g.type_registry.get(obj, ()):
+        if other != self and other.collideable and \
          other.x + other.hitbox.x + other.hitbox.w > self.x + self.hitbox.x + ox and \
          other.y + other.hitbox.y + other.hitbox.h > self.y + self.hitbox.y + oy and \
          other.x + other.hitbox.x < self.x + self.hitbox.x + self.hitbox.w + ox and \
@@ -171,6 +261,7 @@ class Celeste():
       self.move_y(amt)
 
     def move_x(self, amt, start):
+      g = self.g
       if self.solids:
         step = g.sign(amt)
         for i in range(start, abs(amt) + 1):
@@ -184,6 +275,7 @@ class Celeste():
         self.x += amt
 
     def move_y(self, amt):
+      g = self.g
       if self.solids:
         step = g.sign(amt)
         for i in range(abs(amt) + 1):
@@ -196,12 +288,45 @@ class Celeste():
       else:
         self.y += amt
 
+    # pack this object's fields into a flat tuple
+    def save_state(self):
+      return (type(self), self.x, self.y, self.rem.x, self.rem.y, self.spd.x, self.spd.y, self.flip.x, self.flip.y,
+        self.hitbox.x, self.hitbox.y, self.hitbox.w, self.hitbox.h, self.collideable, self.solids, self.spr) + \
+        tuple(getattr(self, f) for f in self.state_fields)
+
+    # names of the fields packed by save_state
+    def state_names(self):
+      return ('type', 'x', 'y', 'rem.x', 'rem.y', 'spd.x', 'spd.y', 'flip.x', 'flip.y',
+        'hitbox.x', 'hitbox.y', 'hitbox.w', 'hitbox.h', 'collideable', 'solids', 'spr') + self.state_fields
+
+    # restore this object's fields from a tuple made by save_state
+    def load_state(self, state):
+      _, self.x, self.y, rx, ry, sx, sy, fx, fy, hx, hy, hw, hh, self.collideable, self.solids, self.spr = state[:16]
+      self.rem = Vector(rx, ry)
+      self.spd = Vector(sx, sy)
+      self.flip = Vector(fx, fy)
+      self.hitbox = Rect(hx, hy, hw, hh)
+      for f, v in zip(self.state_fields, state[16:]):
+        setattr(self, f, v)
+
+    # copies and pickles of an object leave out its game, which adopts it once it's in the game's object list
+    def __getstate__(self):
+      return {f: getattr(self, f) for cls in type(self).__mro__ for f in getattr(cls, '__slots__', ()) if f != 'g' and hasattr(self, f)}
+
+    def __setstate__(self, state):
+      self.g = None
+      for f, v in state.items():
+        setattr(self, f, v)
+
     def __str__(self):
       return f'[{self.__class__.__name__}] x: {self.x}, y: {self.y}, rem: {{{self.rem.x:.4f}, {self.rem.y:.4f}}}, spd: {{{self.spd.x:.4f}, {self.spd.y:.4f}}}'
 
   # objects
 
   class player_spawn(base_obj):
+    state_fields = ('target', 'state', 'delay')
+    __slots__ = state_fields
+
     def init(self):
       self.target = self.y
       self.y = 128
@@ -210,6 +335,7 @@ class Celeste():
       self.delay = 0
 
     def update(self):
+      g = self.g
       # jumping up
       if self.state == 0:
         if self.y < self.target + 16:
@@ -237,6 +363,9 @@ class Celeste():
           g.init_object(g.player, self.x, self.y)
 
   class player(base_obj):
+    state_fields = ('p_jump', 'p_dash', 'grace', 'jbuffer', 'djump', 'dash_time', 'dash_effect_time')
+    __slots__ = state_fields + ('dash_target', 'dash_accel')
+
     def init(self):
       self.p_jump = False
       self.p_dash = False
@@ -251,6 +380,8 @@ class Celeste():
       self.solids = True
 
     def update(self):
+      g = self.g
+      p8 = g.p8
       # horizontal input
       h_input = 1 if p8.btn(g.k_right) else -1 if p8.btn(g.k_left) else 0
 
@@ -349,18 +480,35 @@ class Celeste():
       if self.y < -4:
         g.next_room()
 
+    def save_state(self):
+      return super().save_state() + (self.dash_target.x, self.dash_target.y, self.dash_accel.x, self.dash_accel.y)
+
+    def state_names(self):
+      return super().state_names() + ('dash_target.x', 'dash_target.y', 'dash_accel.x', 'dash_accel.y')
+
+    def load_state(self, state):
+      super().load_state(state[:-4])
+      self.dash_target = Vector(state[-4], state[-3])
+      self.dash_accel = Vector(state[-2], state[-1])
+
     def draw(self):
+      g = self.g
       if self.x < -1 or self.x > 121:
         self.x = g.clamp(self.x, -1, 121)
         self.spd.x = 0
 
   class balloon(base_obj):
+    state_fields = ('timer',)
+    __slots__ = state_fields
+    static = True
+
     def init(self):
       self.timer = 0
       # [change] remove rng, expand hitbox to cover balloon oscillation cycle
       self.hitbox = Rect(-1, -1 - 2, 10, 10 + 4)
 
     def update(self):
+      g = self.g
       if self.spr == 22:
         hit = self.check(g.player, 0, 0)
         if hit and hit.djump < g.max_djump:
@@ -373,6 +521,9 @@ class Celeste():
         self.spr = 22
 
   class platform(base_obj):
+    state_fields = ('last', 'dir')
+    __slots__ = state_fields
+
     def init(self):
       self.x -= 4
       self.hitbox.w = 16
@@ -380,6 +531,7 @@ class Celeste():
       self.dir = -1 if self.spr == 11 else 1
 
     def update(self):
+      g = self.g
       self.spd.x = self.dir * 0.65
       if self.x < -16:
         self.x = 128
@@ -392,11 +544,15 @@ class Celeste():
       self.last = self.x
 
   class fruit(base_obj):
+    state_fields = ('start', 'off')
+    __slots__ = state_fields
+
     def init(self):
       self.start = self.y
       self.off = 0
 
     def update(self):
+      g = self.g
       hit = self.check(g.player, 0, 0)
       if hit:
         hit.djump = g.max_djump
@@ -405,12 +561,16 @@ class Celeste():
       self.y = self.start + math.sin(self.off / 40) * 2.5
 
   class fly_fruit(base_obj):
+    state_fields = ('fly', 'step')
+    __slots__ = state_fields
+
     def init(self):
       self.fly = False
       self.step = 0.5
       self.solids = False
 
     def update(self):
+      g = self.g
       if self.fly:
         self.spd.y = g.appr(self.spd.y, -3.5, 0.25)
         if self.y < -16:
@@ -426,7 +586,10 @@ class Celeste():
         g.destroy_object(self)
 
   class fake_wall(base_obj):
+    __slots__ = ()
+
     def update(self):
+      g = self.g
       self.hitbox.w = 18
       self.hitbox.h = 18
       hit = self.check(g.player, -1, -1)
@@ -440,11 +603,17 @@ class Celeste():
       self.hitbox.h = 16
 
   class spring(base_obj):
+    state_fields = ('hide_in', 'hide_for', 'delay')
+    __slots__ = state_fields
+    static = True
+
     def init(self):
       self.hide_in = 0
       self.hide_for = 0
+      self.delay = 0
 
     def update(self):
+      g = self.g
       if self.hide_for > 0:
         self.hide_for -= 1
         if self.hide_for <= 0:
@@ -472,10 +641,16 @@ class Celeste():
           self.spr = 0
 
   class fall_floor(base_obj):
+    state_fields = ('state', 'delay')
+    __slots__ = state_fields
+    static = True
+
     def init(self):
       self.state = 0
+      self.delay = 0
 
     def update(self):
+      g = self.g
       if self.state == 0:
         if self.check(g.player, 0, -1) or self.check(g.player, -1, 0) or self.check(g.player, 1, 0):
           g.break_fall_floor(self)
@@ -500,22 +675,31 @@ class Celeste():
     if obj.state == 0:
       obj.state = 1
       obj.delay = 15
-      hit = obj.check(g.spring, 0, -1)
+      hit = obj.check(self.spring, 0, -1)
       if hit:
-        g.break_spring(hit)
+        self.break_spring(hit)
 
   class key(base_obj):
+    __slots__ = ()
+    static = True
+
     def update(self):
+      g = self.g
       if self.check(g.player, 0, 0):
         g.destroy_object(self)
         g.has_key = True
 
   class chest(base_obj):
+    state_fields = ('timer',)
+    __slots__ = state_fields
+    static = True
+
     def init(self):
       self.x -= 4
       self.timer = 20
 
     def update(self):
+      g = self.g
       if g.has_key:
         self.timer -= 1
         if self.timer <= 0:
@@ -527,27 +711,131 @@ class Celeste():
 
   # object handling stuff
 
+  # [change] objects are also registered by type (in object list order)
+  # assigning a list stores a copy of it as an ObjectList, which rebuilds the registry when edited in place
+  # player_only is kept up to date with the list, letting steps skip the generic object handling
+  # object_index maps objects to their list positions, so destroyed objects are found without a scan
+  @property
+  def objects(self):
+    return self._objects
+
+  @objects.setter
+  def objects(self, objs):
+    self._objects = objs if type(objs) == ObjectList and objs.game is self else ObjectList(self, objs)
+    self.index_objects()
+
+  # rebuild the type registry and object index from the object list
+  def index_objects(self):
+    objs = self._objects
+    self.type_registry = {}
+    self.type_occupancy = {}
+    self.object_index = {}
+    for i, o in enumerate(objs):
+      if o != None:
+        if o.g == None:
+          o.g = self
+        self.type_registry.setdefault(type(o), []).append(o)
+        self.object_index[o] = i
+        if o.static:
+          self.type_occupancy[type(o)] = self.type_occupancy.get(type(o), 0) | self.object_mask(o)
+    self.destroyed = len(objs) - len(self.object_index)
+    self.player_only = self.is_player_only()
+
+  # add an object appended to the end of the list to the registry
+  def register_object(self, o):
+    if o.g == None:
+      o.g = self
+    self.object_index[o] = len(self._objects) - 1
+    self.type_registry.setdefault(type(o), []).append(o)
+    if o.static:
+      self.type_occupancy[type(o)] = self.type_occupancy.get(type(o), 0) | self.object_mask(o)
+    self.player_only = self.is_player_only()
+
+  # drop the destroyed objects' placeholders from the list (in place, keeping the order)
+  def compact_objects(self):
+    list.__setitem__(self._objects, slice(None), [o for o in self._objects if o != None])
+    self.object_index = {o: i for i, o in enumerate(self._objects)}
+    self.destroyed = 0
+    self.player_only = self.is_player_only()
+
+  def is_player_only(self):
+    return len(self._objects) == 1 and type(self._objects[0]) == self.player
+
   def init_object(self, obj, x, y, tile=None):
-    o = obj(x, y, tile)
-    self.objects.append(o)
+    o = obj(self, x, y, tile)
+    self.object_index[o] = len(self._objects)
+    list.append(self._objects, o)
+    self.type_registry.setdefault(obj, []).append(o)
     if callable(getattr(o, 'init', None)):
       o.init()
+    if o.static:
+      self.type_occupancy[obj] = self.type_occupancy.get(obj, 0) | self.object_mask(o)
+    self.player_only = self.is_player_only()
     return o
 
   def destroy_object(self, obj):
     # [change] remove from list later so update loop doesn't skip
-    self.objects[self.objects.index(obj)] = None
+    list.__setitem__(self._objects, self.object_index.pop(obj), None)
+    self.destroyed += 1
+    self.type_registry[type(obj)].remove(obj)
+    self.player_only = False
+    if obj.static:
+      self.type_occupancy[type(obj)] = 0
+      for o in self.type_registry[type(obj)]:
+        self.type_occupancy[type(obj)] |= self.object_mask(o)
 
   def kill_player(self, obj):
     self.destroy_object(obj)
     self.restart_room()
 
+  # state snapshots
+
+  # pack the game globals and every object's fields into a tuple record
+  def save_state(self):
+    return (self.frames, self.freeze, self.delay_restart, self.has_dashed, self.has_key, self.room.x, self.room.y, self.next_rm,
+      tuple(o.save_state() for o in self.objects))
+
+  # restore the game from a record made by save_state
+  def load_state(self, state):
+    self.frames, self.freeze, self.delay_restart, self.has_dashed, self.has_key, rx, ry, self.next_rm, objs = state
+    self.room = Vector(rx, ry)
+    objects = []
+    for s in objs:
+      o = s[0].__new__(s[0])
+      o.g = self
+      o.load_state(s)
+      objects.append(o)
+    self.objects = objects
+
+  # names of the game globals packed by save_state (followed by the object records)
+  def state_names(self):
+    return ('frames', 'freeze', 'delay_restart', 'has_dashed', 'has_key', 'room.x', 'room.y', 'next_rm')
+
+  # a state record with object types replaced by their names and numbers by floats (0 == 0.0 == -0.0),
+  # so records of different engine variants can be compared
+  def canonical_state(self, state):
+    if type(state) == tuple:
+      return tuple(self.canonical_state(v) for v in state)
+    if type(state) == type:
+      return state.__name__
+    if type(state) == int or type(state) == float:
+      return float(state) + 0.0
+    return state
+
+  # hash of a state record (the current state by default), equal for records that compare equal
+  # any record can be hashed, e.g., Searcheline.state_key(state) to ignore the frame counter
+  def state_hash(self, state=None):
+    state = self.save_state() if state == None else state
+    return hashlib.blake2b(repr(self.canonical_state(state)).encode(), digest_size=16).hexdigest()
+
   # helper functions
 
   def get_player(self):
-    for o in self.objects:
-      if type(o) == self.player_spawn or type(o) == self.player:
-        return o
+    # [change] look up the first player or player_spawn through the registry instead of scanning the objects
+    spawns, players = self.type_registry.get(self.player_spawn), self.type_registry.get(self.player)
+    if spawns and players:
+      return spawns[0] if self.object_index[spawns[0]] < self.object_index[players[0]] else players[0]
+    return spawns[0] if spawns else players[0] if players else None
 
   def clamp(self, val, a, b):
     return max(a, min(b, val))
@@ -558,30 +846,68 @@ class Celeste():
   def sign(self, x):
     return 1 if x > 0 else -1 if x < 0 else 0
 
+  # [change] tile queries use bitmaps of the room (bit tx + 16 * ty), instead of looping over tiles
+
   def tile_flag_at(self, x, y, w, h, flag):
-    for i in range(max(0, int(x / 8)), int(min(15, (x + w - 1) / 8)) + 1):
-      for j in range(max(0, int(y / 8)), int(min(15, (y + h - 1) / 8)) + 1):
-        if p8.fget(self.tile_at(i, j), flag):
-          return True
-    return False
+    return self.tile_mask(x, y, w, h) & self.room_masks()[flag] != 0
 
   def tile_at(self, x, y):
-    return p8.mget(self.room.x * 16 + x, self.room.y * 16 + y)
+    return self.p8.mget(self.room.x * 16 + x, self.room.y * 16 + y)
 
   def spikes_at(self, x, y, w, h, spdx, spdy):
-    for i in range(max(0, int(x / 8)), int(min(15, (x + w - 1) / 8)) + 1):
-      for j in range(max(0, int(y / 8)), int(min(15, (y + h - 1) / 8)) + 1):
-        tile = self.tile_at(i, j)
-        if (tile == 17 and ((y + h - 1) % 8 >= 6 or y + h == j * 8 + 8) and spdy >= 0) or \
-         (tile == 27 and y % 8 <= 2 and spdy <= 0) or \
-         (tile == 43 and x % 8 <= 2 and spdx <= 0) or \
-         (tile == 59 and ((x + w - 1) % 8 >= 6 or x + w == i * 8 + 8) and spdx >= 0):
-          return True
-    return False
-
-  @property
-  def map_data(self):
-    return '''
+    masks = self.room_masks()
+    hit = (masks[8] if (y + h - 1) % 8 >= 6 and spdy >= 0 else 0) | \
+      (masks[9] if y % 8 <= 2 and spdy <= 0 else 0) | \
+      (masks[10] if x % 8 <= 2 and spdx <= 0 else 0) | \
+      (masks[11] if (x + w - 1) % 8 >= 6 and spdx >= 0 else 0)
+    return hit != 0 and self.tile_mask(x, y, w, h) & hit != 0
+
+  # bitmask of the room tiles overlapped by a rect
+  def tile_mask(self, x, y, w, h):
+    i0, i1 = max(0, int(x / 8)), int(min(15, (x + w - 1) / 8))
+    j0, j1 = max(0, int(y / 8)), int(min(15, (y + h - 1) / 8))
+    if i0 > i1 or j0 > j1:
+      return 0
+    return self.tile_range_mask(i0, i1, j0, j1)
+
+  # bitmask of the room tiles overlapped by a rect, with positions outside the room clamped to the border tiles
+  def area_mask(self, x, y, w, h):
+    i0, i1 = min(15, max(0, int(x // 8))), min(15, max(0, int((x + w - 1) // 8)))
+    j0, j1 = min(15, max(0, int(y // 8))), min(15, max(0, int((y + h - 1) // 8)))
+    return self.tile_range_mask(i0, i1, j0, j1)
+
+  def object_mask(self, obj):
+    return self.area_mask(obj.x + obj.hitbox.x, obj.y + obj.hitbox.y, obj.hitbox.w, obj.hitbox.h)
+
+  # bitmask of tile columns i0..i1 on rows j0..j1
+  def tile_range_mask(self, i0, i1, j0, j1):
+    # columns repeated on every row, limited to the rows
+    return ((1 << i1 + 1) - (1 << i0)) * 0x0001000100010001000100010001000100010001000100010001000100010001 & (1 << 16 * j1 + 16) - (1 << 16 * j0)
+
+  # tile bitmaps of the current room: flags 0-7, then up/down/right/left spikes
+  def room_masks(self):
+    masks = self.tile_masks.get((self.room.x, self.room.y))
+    if masks == None:
+      masks = [0] * 12
+      memory = self.p8.memory
+      for ty in range(16):
+        # read a row of the room straight from map memory
+        addr = self.p8.map_addr(self.room.x * 16, self.room.y * 16 + ty)
+        for tx, tile in enumerate(memory[addr:addr + 16]):
+          flags, bit = memory[0x3000 + tile], 1 << tx + 16 * ty
+          for f in range(8):
+            if flags & 1 << f:
+              masks[f] |= bit
+          if tile in (17, 27, 43, 59):
+            masks[8 + (17, 27, 43, 59).index(tile)] |= bit
+      self.tile_masks[(self.room.x, self.room.y)] = masks
+    return masks
+
+  # drop room bitmaps after the map is edited
+  def map_changed(self):
+    self.tile_masks.clear()
+
+  map_data = '''
 2331252548252532323232323300002425262425252631323232252628282824252525252525323328382828312525253232323233000000313232323232323232330000002432323233313232322525252525482525252525252526282824252548252525262828282824254825252526282828283132323225482525252525
 252331323232332900002829000000242526313232332828002824262a102824254825252526002a2828292810244825282828290000000028282900000000002810000000372829000000002a2831482525252525482525323232332828242525254825323338282a283132252548252628382828282a2a2831323232322525
 252523201028380000002a0000003d24252523201028292900282426003a382425252548253300002900002a0031252528382900003a676838280000000000003828393e003a2800000000000028002425253232323232332122222328282425252532332828282900002a283132252526282828282900002a28282838282448
@@ -680,9 +1006,7 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
 628201729300000000a282828382828252528462b20000a38300a382018283821222324252525252525284525222223200000000000000000000000000000000
 '''.replace('\n', '')
 
-  @property
-  def flag_data(self):
-    return '''
+  flag_data = '''
 0000000000000000000000000000000004020000000000000000000200000000030303030303030304040402020000000303030303030303040404020202020200001313131302020302020202020002000013131313020204020202020202020000131313130004040202020202020200001313131300000002020202020202
 0000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000
 '''.replace('\n', '')
@@ -690,17 +1014,17 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
   def __str__(self):
     spikes = {17: 'ʌʌ', 27: 'vv', 43: '> ', 59: ' <'}
     objs = {
-      g.spring: 'ΞΞ',
-      g.fall_floor: '▒▒',
-      g.balloon: '()',
-      g.key: '¤¬',
-      g.chest: '╔╗',
-      g.fruit: '{}',
-      g.fly_fruit: '{}',
-      g.fake_wall: '▓▓',
-      g.platform: 'oo',
-      g.player: ':D',
-      g.player_spawn: ':D'
+      self.spring: 'ΞΞ',
+      self.fall_floor: '▒▒',
+      self.balloon: '()',
+      self.key: '¤¬',
+      self.chest: '╔╗',
+      self.fruit: '{}',
+      self.fly_fruit: '{}',
+      self.fake_wall: '▓▓',
+      self.platform: 'oo',
+      self.player: ':D',
+      self.player_spawn: ':D'
     }
     # init map
     map_str = (['  '] * 16 + ['\n']) * 16
@@ -708,10 +1032,10 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
     for tx in range(16):
       for ty in range(16):
         pos = tx + 17 * ty
-        tile = p8.mget(self.room.x * 16 + tx, self.room.y * 16 + ty)
-        if p8.fget(tile, 4):
+        tile = self.p8.mget(self.room.x * 16 + tx, self.room.y * 16 + ty)
+        if self.p8.fget(tile, 4):
           map_str[pos] = '░░'
-        elif p8.fget(tile, 0):
+        elif self.p8.fget(tile, 0):
           map_str[pos] = '██'
         elif tile in spikes:
           map_str[pos] = spikes[tile]
@@ -724,12 +1048,12 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
         if ox >= 0 and ox <= 15 and oy >= 0 and oy <= 15:
           map_str[pos] = objs[type(o)]
           # draw bigger objs (e.g., clouds)
-          if type(o) == g.platform and ox + 1 <= 15:
+          if type(o) == self.platform and ox + 1 <= 15:
             map_str[pos + 1] = objs[type(o)]
-          elif type(o) == g.fly_fruit:
+          elif type(o) == self.fly_fruit:
             if ox - 1 >= 0: map_str[pos - 1] = ' »'
             if ox + 1 <= 15: map_str[pos + 1] = '« '
-          elif type(o) == g.fake_wall:
+          elif type(o) == self.fake_wall:
             if ox + 1 <= 15: map_str[pos + 1] = objs[type(o)]
             if oy + 1 <= 15: map_str[pos + 17] = objs[type(o)]
             if ox + 1 <= 15 and oy + 1 <= 15: map_str[pos + 18] = objs[type(o)]
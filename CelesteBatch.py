@@ -0,0 +1,378 @@
+import numpy as np
+
+'''
+Batched stepping engine for the player-only subset of Celeste's physics (requires NumPy)
+
+Advances many independent states of the same room by one frame each with a single call, storing the states as arrays
+(one entry per state). Only the player, terrain, spikes, springs and balloons are simulated, matching Celeste.player.update
+and base_obj.move exactly. Dead and exited states are terminal, and are left untouched by further steps.
+
+  > engine = CelesteBatch(p8)
+    - reads the currently loaded room of a PICO-8 instance running Celeste, with the player already spawned
+    - the room may only contain springs and balloons besides the player (see CelesteUtils.suppress_object)
+  > states = engine.init_states(n)
+    - n copies of the game's current state
+  > engine.step_batch(states, inputs)
+    - advance every state by one frame, inputs is a list/array of button states (one per state)
+  > engine.load_state(states, i)
+    - write state i back into the PICO-8 instance's game, to continue with the regular engine
+  > engine.verify(inputs)
+    - step the regular engine alongside the batch engine (one input sequence per state), returning the fields they disagree on
+'''
+
+# per-state fields, and their array types
+player_fields = {
+  'x': np.int64, 'y': np.int64,
+  'rem_x': np.float64, 'rem_y': np.float64,
+  'spd_x': np.float64, 'spd_y': np.float64,
+  'flip_x': np.bool_,
+  'p_jump': np.bool_, 'p_dash': np.bool_,
+  'grace': np.int64, 'jbuffer': np.int64, 'djump': np.int64,
+  'dash_time': np.int64, 'dash_effect_time': np.int64,
+  'dash_target_x': np.float64, 'dash_target_y': np.float64,
+  'dash_accel_x': np.float64, 'dash_accel_y': np.float64,
+  'freeze': np.int64,
+  'dead': np.bool_, 'exited': np.bool_
+}
+
+# per-state fields of each spring and balloon (arrays with one column per object)
+spring_fields = {'spring_spr': np.int64, 'spring_delay': np.int64, 'spring_hide_in': np.int64, 'spring_hide_for': np.int64}
+balloon_fields = {'balloon_spr': np.int64, 'balloon_timer': np.int64}
+
+class BatchStates():
+  def __init__(self, n, n_springs=0, n_balloons=0):
+    for f, t in player_fields.items():
+      setattr(self, f, np.zeros(n, t))
+    for f, t in spring_fields.items():
+      setattr(self, f, np.zeros((n, n_springs), t))
+    for f, t in balloon_fields.items():
+      setattr(self, f, np.zeros((n, n_balloons), t))
+
+  def __len__(self):
+    return len(self.x)
+
+  # select a subset of the states (index array, slice or boolean mask)
+  def __getitem__(self, idx):
+    sub = BatchStates.__new__(BatchStates)
+    for f in (*player_fields, *spring_fields, *balloon_fields):
+      setattr(sub, f, getattr(self, f)[idx])
+    return sub
+
+  # states still being simulated
+  @property
+  def alive(self):
+    return ~(self.dead | self.exited)
+
+class CelesteBatch():
+  def __init__(self, p8):
+    self.p8 = p8
+    g = p8.game
+    if type(g.get_player()) != g.player:
+      raise ValueError('the player must be spawned')
+    # update order of the player, springs and balloons
+    self.order, self.springs, self.balloons = [], [], []
+    for o in g.objects:
+      if type(o) == g.player:
+        self.order.append(('player', 0))
+      elif type(o) == g.spring:
+        self.order.append(('spring', len(self.springs)))
+        self.springs.append(o)
+      elif type(o) == g.balloon:
+        self.order.append(('balloon', len(self.balloons)))
+        self.balloons.append(o)
+      else:
+        raise ValueError(f'unsupported object: {type(o).__name__}')
+    self.max_djump = g.max_djump
+    # room tile grids (row ty, column tx): solid, ice, then up/down/right/left spikes
+    masks = g.room_masks()
+    grid = lambda mask: np.array([[mask >> tx + 16 * ty & 1 for tx in range(16)] for ty in range(16)], np.bool_)
+    self.solid, self.ice = grid(masks[0]), grid(masks[4])
+    self.spikes = [grid(m) for m in masks[8:12]]
+
+  # n copies of the game's current state
+  def init_states(self, n):
+    states = BatchStates(n, len(self.springs), len(self.balloons))
+    for f, v in self.read_state().items():
+      getattr(states, f)[:] = v
+    return states
+
+  # the game's current state, by field (a list with one value per object for spring and balloon fields)
+  def read_state(self):
+    g = self.p8.game
+    p = g.get_player()
+    springs, balloons = self.room_objects()
+    return {
+      'x': p.x, 'y': p.y, 'rem_x': p.rem.x, 'rem_y': p.rem.y, 'spd_x': p.spd.x, 'spd_y': p.spd.y, 'flip_x': p.flip.x,
+      'p_jump': p.p_jump, 'p_dash': p.p_dash, 'grace': p.grace, 'jbuffer': p.jbuffer, 'djump': p.djump,
+      'dash_time': p.dash_time, 'dash_effect_time': p.dash_effect_time,
+      'dash_target_x': p.dash_target.x, 'dash_target_y': p.dash_target.y, 'dash_accel_x': p.dash_accel.x, 'dash_accel_y': p.dash_accel.y,
+      'freeze': g.freeze,
+      'spring_spr': [s.spr for s in springs], 'spring_delay': [s.delay for s in springs],
+      'spring_hide_in': [s.hide_in for s in springs], 'spring_hide_for': [s.hide_for for s in springs],
+      'balloon_spr': [b.spr for b in balloons], 'balloon_timer': [b.timer for b in balloons]
+    }
+
+  # the game's current springs and balloons (the game's load_state replaces its objects)
+  def room_objects(self):
+    g = self.p8.game
+    return [o for o in g.objects if type(o) == g.spring], [o for o in g.objects if type(o) == g.balloon]
+
+  # write state i back into the game
+  def load_state(self, states, i):
+    g = self.p8.game
+    p = g.get_player()
+    p.x, p.y = int(states.x[i]), int(states.y[i])
+    p.rem.x, p.rem.y = float(states.rem_x[i]), float(states.rem_y[i])
+    p.spd.x, p.spd.y = float(states.spd_x[i]), float(states.spd_y[i])
+    p.flip.x = bool(states.flip_x[i])
+    p.p_jump, p.p_dash = bool(states.p_jump[i]), bool(states.p_dash[i])
+    p.grace, p.jbuffer, p.djump = int(states.grace[i]), int(states.jbuffer[i]), int(states.djump[i])
+    p.dash_time, p.dash_effect_time = int(states.dash_time[i]), int(states.dash_effect_time[i])
+    p.dash_target.x, p.dash_target.y = float(states.dash_target_x[i]), float(states.dash_target_y[i])
+    p.dash_accel.x, p.dash_accel.y = float(states.dash_accel_x[i]), float(states.dash_accel_y[i])
+    g.freeze = int(states.freeze[i])
+    springs, balloons = self.room_objects()
+    for j, s in enumerate(springs):
+      s.spr, s.delay = int(states.spring_spr[i, j]), int(states.spring_delay[i, j])
+      s.hide_in, s.hide_for = int(states.spring_hide_in[i, j]), int(states.spring_hide_for[i, j])
+    for j, b in enumerate(balloons):
+      b.spr, b.timer = int(states.balloon_spr[i, j]), int(states.balloon_timer[i, j])
+
+  # advance every state by one frame
+  def step_batch(self, states, inputs):
+    btn = np.asarray(inputs, np.int64)
+    active = states.alive
+    # freeze frames skip the update
+    frozen = active & (states.freeze > 0)
+    states.freeze[frozen] -= 1
+    # the draw step (x clamp) runs once freeze has run out
+    self.draw(states, frozen & (states.freeze == 0))
+    active &= ~frozen
+    for kind, i in self.order:
+      if kind == 'player':
+        self.move(states, active)
+        self.update_player(states, active, btn)
+      elif kind == 'spring':
+        self.update_spring(states, active, i)
+      else:
+        self.update_balloon(states, active, i)
+    # dead players are removed before drawing, and freezing skips the draw step
+    self.draw(states, active & ~states.dead & (states.freeze == 0))
+    return states
+
+  # step the regular engine in lockstep with the batch engine from the game's current state, to check that they agree
+  # inputs is a list of input sequences of the same length (one per state), each state is checked until it's dead or exited
+  # returns the first mismatch of each state that diverges, as (state index, frame, field, game value, batch value)
+  # the game's state is restored afterward
+  def verify(self, inputs):
+    g = self.p8.game
+    start = g.save_state()
+    level_id = g.level_index()
+    states = self.init_states(len(inputs))
+    snapshots = [start] * len(inputs)
+    running = set(range(len(inputs)))
+    mismatches = []
+    try:
+      for f, btn in enumerate(zip(*inputs)):
+        self.step_batch(states, btn)
+        for i in sorted(running):
+          g.load_state(snapshots[i])
+          self.p8.set_btn_state(btn[i])
+          self.p8.step()
+          snapshots[i] = g.save_state()
+          exited = g.level_index() != level_id
+          dead = not exited and (type(g.get_player()) != g.player or g.delay_restart > 0)
+          expected = {'dead': dead, 'exited': exited}
+          if dead or exited:
+            running.remove(i)
+          else:
+            expected.update(self.read_state())
+          for field, value in expected.items():
+            batch_value = getattr(states, field)[i].tolist()
+            if value != batch_value:
+              mismatches.append((i, f, field, value, batch_value))
+              running.discard(i)
+              break
+    finally:
+      g.load_state(start)
+    return mismatches
+
+  # objects
+
+  def update_spring(self, states, m, i):
+    s = self.springs[i]
+    spr, delay = states.spring_spr[:, i], states.spring_delay[:, i]
+    hide_in, hide_for = states.spring_hide_in[:, i], states.spring_hide_for[:, i]
+    hiding = m & (hide_for > 0)
+    hide_for[hiding] -= 1
+    delay[hiding & (hide_for <= 0)] = 0
+    ready = m & ~hiding & (spr == 18)
+    hit = ready & ~states.dead & self.overlaps(states, s.x, s.y, s.hitbox) & (states.spd_y >= 0)
+    spr[hit] = 19
+    states.y[hit] = s.y - 4
+    states.spd_x[hit] *= 0.2
+    states.spd_y[hit] = -3
+    states.djump[hit] = self.max_djump
+    delay[hit] = 10
+    waiting = m & ~hiding & ~ready & (delay > 0)
+    delay[waiting] -= 1
+    spr[waiting & (delay <= 0)] = 18
+    hide = m & (hide_in > 0)
+    hide_in[hide] -= 1
+    hide &= hide_in <= 0
+    hide_for[hide] = 60
+    spr[hide] = 0
+
+  def update_balloon(self, states, m, i):
+    b = self.balloons[i]
+    spr, timer = states.balloon_spr[:, i], states.balloon_timer[:, i]
+    ready = m & (spr == 22)
+    hit = ready & ~states.dead & self.overlaps(states, b.x, b.y, b.hitbox) & (states.djump < self.max_djump)
+    states.djump[hit] = self.max_djump
+    spr[hit] = 0
+    timer[hit] = 60
+    waiting = m & ~ready & (timer > 0)
+    timer[waiting] -= 1
+    spr[m & ~ready & ~waiting] = 22
+
+  # player hitbox overlaps an object's hitbox (object.check(g.player, 0, 0))
+  def overlaps(self, states, x, y, hitbox):
+    px, py = states.x + 1, states.y + 3
+    return (px + 6 > x + hitbox.x) & (py + 5 > y + hitbox.y) & (px < x + hitbox.x + hitbox.w) & (py < y + hitbox.y + hitbox.h)
+
+  # base_obj.move for the player
+  def move(self, states, m):
+    states.rem_x[m] += states.spd_x[m]
+    amt = np.floor(states.rem_x + 0.5).astype(np.int64)
+    states.rem_x[m] -= amt[m]
+    self.move_axis(states, m, amt, 'x')
+    states.rem_y[m] += states.spd_y[m]
+    amt = np.floor(states.rem_y + 0.5).astype(np.int64)
+    states.rem_y[m] -= amt[m]
+    self.move_axis(states, m, amt, 'y')
+
+  # base_obj.move_x/move_y: step one pixel at a time (abs(amt) + 1 checks) until blocked
+  def move_axis(self, states, m, amt, axis):
+    pos, spd, rem = getattr(states, axis), getattr(states, 'spd_' + axis), getattr(states, 'rem_' + axis)
+    step = np.sign(amt)
+    zero = np.zeros_like(step)
+    moving = m.copy()
+    for i in range(int(np.abs(amt[m]).max(initial=-1)) + 1):
+      moving &= i < np.abs(amt) + 1
+      blocked = moving & (self.is_solid(states, step, zero) if axis == 'x' else self.is_solid(states, zero, step))
+      spd[blocked] = 0
+      rem[blocked] = 0
+      moving &= ~blocked
+      pos[moving] += step[moving]
+
+  # Celeste.player.update
+  def update_player(self, states, active, btn):
+    s, m = states, active
+    h_input = np.where(btn & 2 != 0, 1, np.where(btn & 1 != 0, -1, 0))
+
+    # spike collision and bottom death
+    s.dead |= m & (self.spikes_at(s) | (s.y > 128))
+
+    on_ground = self.is_solid(s, 0, 1)
+
+    jump = (btn & 16 != 0) & ~s.p_jump
+    dash = (btn & 32 != 0) & ~s.p_dash
+    s.p_jump[m] = btn[m] & 16 != 0
+    s.p_dash[m] = btn[m] & 32 != 0
+
+    # jump buffer
+    s.jbuffer[m & jump] = 4
+    s.jbuffer[m & ~jump & (s.jbuffer > 0)] -= 1
+
+    # grace frames and dash restoration
+    s.grace[m & ~on_ground & (s.grace > 0)] -= 1
+    s.grace[m & on_ground] = 6
+    s.djump[m & on_ground] = self.max_djump
+
+    s.dash_effect_time[m] -= 1
+
+    # dashing
+    dashing = m & (s.dash_time > 0)
+    s.dash_time[dashing] -= 1
+    s.spd_x[dashing] = appr(s.spd_x, s.dash_target_x, s.dash_accel_x)[dashing]
+    s.spd_y[dashing] = appr(s.spd_y, s.dash_target_y, s.dash_accel_y)[dashing]
+
+    m = m & ~dashing
+    accel = np.where(on_ground, np.where(self.is_ice(s, 0, 1), 0.05, 0.6), 0.4)
+    s.spd_x[m] = np.where(np.abs(s.spd_x) <= 1, appr(s.spd_x, h_input * 1, accel), appr(s.spd_x, np.sign(s.spd_x) * 1, 0.15))[m]
+
+    # facing direction
+    facing = m & (s.spd_x != 0)
+    s.flip_x[facing] = s.spd_x[facing] < 0
+
+    # terminal vel + wall sliding
+    maxfall = np.where((h_input != 0) & self.is_solid(s, h_input, 0) & ~self.is_ice(s, h_input, 0), 0.4, 2)
+
+    # apply gravity
+    falling = m & ~on_ground
+    s.spd_y[falling] = appr(s.spd_y, maxfall, np.where(np.abs(s.spd_y) > 0.15, 0.21, 0.105))[falling]
+
+    # jump
+    jumping = m & (s.jbuffer > 0)
+    ground_jump = jumping & (s.grace > 0)
+    s.jbuffer[ground_jump] = 0
+    s.grace[ground_jump] = 0
+    s.spd_y[ground_jump] = -2
+    wall_dir = np.where(self.is_solid(s, -3, 0), -1, np.where(self.is_solid(s, 3, 0), 1, 0))
+    wall_jump = jumping & ~ground_jump & (wall_dir != 0)
+    s.jbuffer[wall_jump] = 0
+    s.spd_y[wall_jump] = -2
+    s.spd_x[wall_jump] = (-wall_dir * 2)[wall_jump]
+
+    # dash
+    d_full = 5
+    d_half = 3.5355339059
+
+    dashed = m & (s.djump > 0) & dash
+    s.djump[dashed] -= 1
+    s.dash_time[dashed] = 4
+    s.dash_effect_time[dashed] = 10
+    v_input = np.where(btn & 4 != 0, -1, np.where(btn & 8 != 0, 1, 0))
+    s.spd_x[dashed] = np.where(h_input != 0, h_input * np.where(v_input == 0, d_full, d_half), np.where(v_input != 0, 0, np.where(s.flip_x, -1, 1)))[dashed]
+    s.spd_y[dashed] = np.where(v_input != 0, v_input * np.where(h_input == 0, d_full, d_half), 0)[dashed]
+    s.freeze[dashed] = 2
+    s.dash_target_x[dashed] = 2 * np.sign(s.spd_x[dashed])
+    s.dash_target_y[dashed] = (np.where(s.spd_y >= 0, 2, 1.5) * np.sign(s.spd_y))[dashed]
+    s.dash_accel_x[dashed] = np.where(s.spd_y == 0, 1.5, 1.06066017177)[dashed]
+    s.dash_accel_y[dashed] = np.where(s.spd_x == 0, 1.5, 1.06066017177)[dashed]
+
+    # exit level off the top
+    s.exited |= active & (s.y < -4)
+
+  # Celeste.player.draw
+  def draw(self, states, m):
+    out = m & ((states.x < -1) | (states.x > 121))
+    states.x[out] = np.clip(states.x[out], -1, 121)
+    states.spd_x[out] = 0
+
+  # terrain queries on the player's hitbox (the hitbox spans at most 2x2 tiles)
+
+  def is_solid(self, states, ox, oy):
+    return self.tile_hit(self.solid, states.x + 1 + ox, states.y + 3 + oy, 6, 5)
+
+  def is_ice(self, states, ox, oy):
+    return self.tile_hit(self.ice, states.x + 1 + ox, states.y + 3 + oy, 6, 5)
+
+  def spikes_at(self, states):
+    x, y, w, h = states.x + 1, states.y + 3, 6, 5
+    up, down, right, left = self.spikes
+    return self.tile_hit(up, x, y, w, h) & ((y + h - 1) % 8 >= 6) & (states.spd_y >= 0) | \
+      self.tile_hit(down, x, y, w, h) & (y % 8 <= 2) & (states.spd_y <= 0) | \
+      self.tile_hit(right, x, y, w, h) & (x % 8 <= 2) & (states.spd_x <= 0) | \
+      self.tile_hit(left, x, y, w, h) & ((x + w - 1) % 8 >= 6) & (states.spd_x >= 0)
+
+  # any tile of a grid overlapped by the rects, using the same tile bounds as Celeste.tile_flag_at
+  def tile_hit(self, grid, x, y, w, h):
+    i0, i1 = np.maximum(0, np.trunc(x / 8)).astype(np.int64), np.trunc(np.minimum(15, (x + w - 1) / 8)).astype(np.int64)
+    j0, j1 = np.maximum(0, np.trunc(y / 8)).astype(np.int64), np.trunc(np.minimum(15, (y + h - 1) / 8)).astype(np.int64)
+    valid = (i0 <= i1) & (j0 <= j1)
+    i0, i1, j0, j1 = (np.clip(v, 0, 15) for v in (i0, i1, j0, j1))
+    return valid & (grid[j0, i0] | grid[j0, i1] | grid[j1, i0] | grid[j1, i1])
+
+def appr(val, target, amt):
+  return np.where(val > target, np.maximum(val - amt, target), np.minimum(val + amt, target))
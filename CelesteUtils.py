@@ -69,4 +69,10 @@ def watch_inputs(p8, inputs):
     p8.set_btn_state(a)
     p8.step()
     print(p8.input_display)
-    print(p8.game)
\ No newline at end of file
+    print(p8.game)
+
+# load a class (e.g., a cart or a search problem) from a 'module.Class' path
+def load_class(path):
+  import importlib
+  module, name = path.rsplit('.', 1)
+  return getattr(importlib.import_module(module), name)
\ No newline at end of file
@@ -1,4 +1,7 @@
 class PICO8():
+  # memory image (map and flags) of each decoded cart class
+  _cart_memory = {}
+
   def __init__(self, cart):
     self._btn_state = 0
     self.load_game(cart)
@@ -9,14 +12,41 @@ class PICO8():
     return self._btn_state & (2 ** i) != 0
 
   def mset(self, x, y, tile):
-    self._memory['map'][x + y * 128] = tile
+    self._memory[self.map_addr(x, y)] = tile
+    # let the game drop anything it derived from the map
+    if callable(getattr(self._game, 'map_changed', None)):
+      self._game.map_changed()
 
   def mget(self, x, y):
-    return self._memory['map'][x + y * 128]
+    return self._memory[x + y * 128 + (0x2000 if y < 32 else 0)]
 
   def fget(self, n, f=None):
-    flags = self._memory['flags'][n]
-    return flags if f == None else flags & 2 ** f != 0
+    flags = self._memory[0x3000 + n]
+    return flags if f == None else flags & 1 << f != 0
+
+  # memory
+
+  # address of a map tile, rows 32-63 share the lower half of the sprite sheet (0x1000-0x1fff)
+  def map_addr(self, x, y):
+    return x + y * 128 + (0x2000 if y < 32 else 0)
+
+  # zero-copy, read-only view of the console's memory (0x1000-0x2fff map, 0x3000-0x30ff sprite flags)
+  # writes go through mset/load_map, so the game can drop anything it derived from the map
+  @property
+  def memory(self):
+    return memoryview(self._memory).toreadonly()
+
+  # copy of the whole map, e.g., to undo room edits
+  def save_map(self):
+    return bytes(self._memory[0x1000:0x3000])
+
+  # restore a map copied by save_map
+  def load_map(self, data):
+    if len(data) != 0x2000:
+      raise ValueError(f'map data must be {0x2000} bytes, got {len(data)}')
+    self._memory[0x1000:0x3000] = data
+    if callable(getattr(self._game, 'map_changed', None)):
+      self._game.map_changed()
 
   # console commands
 
@@ -24,12 +54,22 @@ class PICO8():
   def load_game(self, cart):
     self._cart = cart
     self._game = self._cart(self)
-    self._memory = {
-      'map': [int(self._game.map_data[i:i + 2][::1 if i < 8192 else -1], 16) for i in range(0, len(self._game.map_data), 2)],
-      'flags': [int(self._game.flag_data[i:i + 2], 16) for i in range(0, len(self._game.flag_data), 2)]
-    }
+    # the cart's memory image is only decoded once per cart class, each console gets its own copy
+    if cart not in PICO8._cart_memory:
+      PICO8._cart_memory[cart] = self.decode_cart(self._game)
+    self._memory = bytearray(PICO8._cart_memory[cart])
     self._game._init()
 
+  # decode a cart's hex map and flag data into a memory image
+  # map tiles past 8192 hex digits come from the sprite sheet, and are stored with swapped nibbles
+  @staticmethod
+  def decode_cart(game):
+    memory = bytearray(0x8000)
+    memory[0x2000:0x3000] = bytes.fromhex(game.map_data[:8192])
+    memory[0x1000:0x2000] = bytes((b & 15) << 4 | b >> 4 for b in bytes.fromhex(game.map_data[8192:]))
+    memory[0x3000:0x3100] = bytes.fromhex(game.flag_data)
+    return bytes(memory)
+
   # reload the current cart
   def reset(self):
     self.load_game(self._cart)
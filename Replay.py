@@ -0,0 +1,157 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+import CelesteUtils as utils
+
+import argparse
+import json
+import multiprocessing
+import re
+import sys
+
+'''
+Headless replays of input sequences
+
+  > python Replay.py tas/*.txt --level 3 --output results.json
+    - replays every input file from the start of a level at full speed, spread over a pool of worker processes
+    - an input file holds button states (0bxzdurl) separated by commas or whitespace, e.g., a printed Searcheline solution
+      (labelled lines other than 'inputs:', such as 'frames: 35', are skipped)
+    - reports the frame count, whether the level was exited, and a checksum of the final state per file
+  > python Replay.py tas/*.txt --level 3 --baseline results.json
+    - compare checksums against an earlier run, exiting with an error if any replay changed
+  > python Replay.py tas/*.txt --level 3 --lockstep MyCarts.FastCeleste
+    - step each replay on Celeste and another cart side by side, reporting the first frame where their states differ
+'''
+
+# consoles of a worker process (the second one is only used for lockstep replays)
+_p8, _p8_lockstep = None, None
+
+def _init_worker(cart, lockstep_cart=None):
+  global _p8, _p8_lockstep
+  _p8 = PICO8(cart)
+  _p8_lockstep = PICO8(lockstep_cart) if lockstep_cart else None
+
+# read button states from an input file
+# labelled lines (e.g., 'frames: 35' in a printed solution) are skipped, except for the inputs line
+def read_inputs(path):
+  inputs = []
+  with open(path) as f:
+    for line in f:
+      label = re.match(r'\s*(\w+):', line)
+      if label and label.group(1) != 'inputs':
+        continue
+      inputs.extend(int(a) for a in re.findall(r'\d+', line[label.end():] if label else line))
+  return inputs
+
+# reset a console (or create one) and load the start of a level
+def start_level(p8, level_id, loading_jank=False, skip_spawn=False):
+  if p8 == None:
+    p8 = PICO8(Celeste)
+  else:
+    p8.reset()
+  utils.load_room(p8, level_id, loading_jank)
+  if skip_spawn:
+    utils.skip_player_spawn(p8)
+  return p8
+
+# replay inputs from the start of a level, stopping once the level is exited
+# with checksums=True, the state hash after every frame is also returned
+def replay(inputs, level_id, loading_jank=False, skip_spawn=False, p8=None, checksums=False):
+  p8 = start_level(p8, level_id, loading_jank, skip_spawn)
+  # record the exit instead of loading the next room
+  exited = []
+  def exit_room(): exited.append(True)
+  p8.game.next_room = exit_room
+  frames, frame_checksums = 0, []
+  for a in inputs:
+    p8.set_btn_state(a)
+    p8.step()
+    frames += 1
+    if checksums:
+      frame_checksums.append(p8.game.state_hash())
+    if exited:
+      break
+  state = p8.game.save_state()
+  result = {'frames': frames, 'exited': bool(exited), 'state': state, 'checksum': p8.game.state_hash(state)}
+  if checksums:
+    result['checksums'] = frame_checksums
+  return result
+
+# fields that differ between the current states of two games, as (field, value in a, value in b)
+def state_diff(game_a, game_b):
+  a = game_a.canonical_state(game_a.save_state())
+  b = game_b.canonical_state(game_b.save_state())
+  diff = [(name, x, y) for name, x, y in zip(game_a.state_names(), a, b) if x != y]
+  if len(a[-1]) != len(b[-1]):
+    diff.append(('len(objects)', len(a[-1]), len(b[-1])))
+  for i, (o, sa, sb) in enumerate(zip(game_a.objects, a[-1], b[-1])):
+    diff.extend((f'objects[{i}].{name}', x, y) for name, x, y in zip(o.state_names(), sa, sb) if x != y)
+  return diff
+
+# step two consoles on the same inputs from their current states, stopping at the first diverging frame
+# returns None if the states never differ, otherwise (frames stepped, state_diff)
+def lockstep(p8_a, p8_b, inputs):
+  for frame in range(len(inputs) + 1):
+    if p8_a.game.state_hash() != p8_b.game.state_hash():
+      return frame, state_diff(p8_a.game, p8_b.game)
+    if frame < len(inputs):
+      for p8 in (p8_a, p8_b):
+        p8.set_btn_state(inputs[frame])
+        p8.step()
+  return None
+
+# replay an input file in a worker process
+def _replay_file(task):
+  path, level_id, loading_jank, skip_spawn = task
+  inputs = read_inputs(path)
+  if _p8_lockstep:
+    start_level(_p8, level_id, loading_jank, skip_spawn)
+    start_level(_p8_lockstep, level_id, loading_jank, skip_spawn)
+    found = lockstep(_p8, _p8_lockstep, inputs)
+    return path, {'diverged': found != None, 'frame': found[0] if found else None, 'diff': found[1] if found else []}
+  r = replay(inputs, level_id, loading_jank, skip_spawn, _p8)
+  del r['state']
+  return path, r
+
+# replay input files over a pool of worker processes, yielding (path, result) in order as they finish
+# with a lockstep cart, each file is instead stepped on both carts, reporting where they diverge
+def replay_files(paths, level_id, loading_jank=False, skip_spawn=False, workers=None, cart=Celeste, lockstep_cart=None):
+  tasks = [(path, level_id, loading_jank, skip_spawn) for path in paths]
+  with multiprocessing.Pool(workers, _init_worker, (cart, lockstep_cart)) as pool:
+    yield from pool.imap(_replay_file, tasks, chunksize=max(1, len(tasks) // (4 * (workers or multiprocessing.cpu_count()))))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='replay input files headlessly')
+  parser.add_argument('files', nargs='+', help='input files to replay')
+  parser.add_argument('--level', type=int, default=0, help='level id the inputs start from (default 0)')
+  parser.add_argument('--loading-jank', action='store_true', help='simulate vanilla loading jank when loading the level')
+  parser.add_argument('--skip-spawn', action='store_true', help='start the inputs after the player spawn animation')
+  parser.add_argument('--workers', type=int, help='number of worker processes (default: one per core)')
+  parser.add_argument('--output', help='write results to this JSON file')
+  parser.add_argument('--baseline', help='compare checksums against results in this JSON file')
+  parser.add_argument('--lockstep', help="cart to step alongside Celeste as 'module.Class', reporting the first diverging frame")
+  args = parser.parse_args()
+
+  if args.lockstep:
+    diverged = False
+    for path, r in replay_files(args.files, args.level, args.loading_jank, args.skip_spawn, args.workers, lockstep_cart=utils.load_class(args.lockstep)):
+      print(f"{path}: diverged after {r['frame']} frames" if r['diverged'] else f"{path}: ok")
+      for name, a, b in r['diff']:
+        print(f"  {name}: {a} != {b}")
+      diverged = diverged or r['diverged']
+    sys.exit(1 if diverged else 0)
+
+  results = {}
+  for path, r in replay_files(args.files, args.level, args.loading_jank, args.skip_spawn, args.workers):
+    results[path] = r
+    print(f"{path}: {r['frames']} frames, {'exited' if r['exited'] else 'not exited'}, {r['checksum'][:16]}")
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    changed = [path for path, r in results.items() if path in baseline and baseline[path]['checksum'] != r['checksum']]
+    for path in changed:
+      print(f"changed: {path}")
+    if changed:
+      sys.exit(1)
@@ -0,0 +1,134 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+from Searcheline import Searcheline
+import CelesteUtils as utils
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+'''
+Route search over consecutive levels
+
+  > python RouteSearch.py RouteSearch.RoomSearch:30 MyProblems.Search200:40 --level 0 --top-k 3 --workers 4
+    - searches each room in turn (one search problem and max depth per level), starting from the states the previous room can be exited into
+    - the exit state matters: loading jank updates some of the next room's objects once more, depending on how many objects the previous room had on exit
+    - keeps the top-k fastest distinct room entries per level, and prints the fastest input chain over all levels
+  > use --cache route.json to keep the solutions of each room subproblem in a file, reused by reruns
+
+Room search problems inherit from RoomSearch, which starts from the room as entered (RoomSearch.entry) and skips the player spawn
+  - override allowable_actions, h_cost, etc. as for any Searcheline problem
+  - init_state shouldn't change the room (e.g., suppress objects), since solutions are replayed on the unmodified game to find the next room's entry
+'''
+
+# search problem for one room of a route, started from the state the room was entered in
+class RoomSearch(Searcheline):
+  # game state right after the room was loaded, set before searching
+  entry = None
+
+  # the room as entered, stepped past the player spawn (the number of frames this takes is kept in spawn_frames)
+  def init_state(self):
+    self.p8.game.load_state(self.entry)
+    self.p8.set_btn_state(0)
+    self.spawn_frames = 0
+    while type(self.p8.game.get_player()) == self.p8.game.player_spawn:
+      self.p8.step()
+      self.spawn_frames += 1
+    return self.p8.game.objects
+
+# search a room subproblem in a worker process, returning every solution's inputs from the room's entry (player spawn included)
+def _search_room(task):
+  cls, cart, entry, max_depth, complete = task
+  s = cls(cart)
+  s.verbose = False
+  s.entry = entry
+  with contextlib.redirect_stdout(io.StringIO()):
+    solutions = s.search(max_depth, complete=complete)
+  return [[0] * s.spawn_frames + inputs for inputs in solutions]
+
+# step inputs from a room's entry until the room is exited, on a console that loads the next room like the game does
+# returns (inputs up to the exit, entry of the next room), or None if the room isn't exited
+def exit_room(p8, entry, inputs):
+  p8.game.load_state(entry)
+  level_id = p8.game.level_index()
+  for i, a in enumerate(inputs):
+    p8.set_btn_state(a)
+    p8.step()
+    if p8.game.level_index() != level_id:
+      return inputs[:i + 1], p8.game.save_state()
+  return None
+
+# search consecutive rooms, chaining each room's fastest exits into the next room
+# rooms is a list of (RoomSearch problem class, max depth), for the levels starting at level_id
+# returns up to top_k routes through every room (fastest first) as (inputs, frames taken in each room)
+def search_route(rooms, level_id=0, loading_jank=False, top_k=3, complete=False, workers=None, cache=None, cart=Celeste):
+  timer = time.time()
+  p8 = PICO8(cart)
+  utils.load_room(p8, level_id, loading_jank)
+  entry = p8.game.save_state()
+  # routes into the current room by entry (ignoring the frame counter): (entry, inputs so far, frames taken in each room)
+  routes = {entry[1:]: (entry, [], [])}
+  # solutions of room subproblems, by problem key
+  results = {}
+  if cache and os.path.exists(cache):
+    with open(cache) as f:
+      results = json.load(f)
+  searchers = {}
+  pool = multiprocessing.Pool(workers) if workers and workers > 1 else None
+  try:
+    for i, (cls, max_depth) in enumerate(rooms):
+      print(f"level {level_id + i} ({len(routes)} entries)...")
+      # the problem key covers the map, the entry (by state_key, so not the frame counter) and the problem's code
+      if cls not in searchers:
+        searchers[cls] = cls(cart)
+      keys = [f'{searchers[cls].problem_key(entry)}-{max_depth}-{complete}' for entry, _, _ in routes.values()]
+      tasks = {key: (cls, cart, entry, max_depth, complete) for key, (entry, _, _) in zip(keys, routes.values()) if key not in results}
+      found = pool.map(_search_room, tasks.values()) if pool else map(_search_room, tasks.values())
+      results.update(zip(tasks, found))
+      if cache:
+        with open(cache + '.tmp', 'w') as f:
+          json.dump(results, f)
+        os.replace(cache + '.tmp', cache)
+      # keep the fastest route into each distinct entry of the next room
+      exits = {}
+      for key, (entry, inputs, splits) in zip(keys, routes.values()):
+        for room_inputs in results[key]:
+          exited = exit_room(p8, entry, room_inputs)
+          if exited == None:
+            continue
+          room_inputs, next_entry = exited
+          if next_entry[1:] not in exits or len(inputs) + len(room_inputs) < len(exits[next_entry[1:]][1]):
+            exits[next_entry[1:]] = (next_entry, inputs + room_inputs, splits + [len(room_inputs)])
+      routes = dict(sorted(exits.items(), key=lambda route: len(route[1][1]))[:top_k])
+      print(f"  searched {len(tasks)} of {len(keys)} entries, fastest: {min((len(inputs) for _, inputs, _ in routes.values()), default=None)} frames")
+      print(f"  elapsed time: {time.time() - timer:.2f} [s]")
+      if not routes:
+        break
+  finally:
+    if pool:
+      pool.terminate()
+  return [(inputs, splits) for _, inputs, splits in routes.values()]
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='search a route over consecutive levels')
+  parser.add_argument('rooms', nargs='+', help="search problem and max depth of each room as 'module.Class:max_depth'")
+  parser.add_argument('--level', type=int, default=0, help='level id of the first room (default 0)')
+  parser.add_argument('--loading-jank', action='store_true', help='simulate vanilla loading jank when loading the first room')
+  parser.add_argument('--top-k', type=int, default=3, help='room entries kept per level (default 3)')
+  parser.add_argument('--complete', action='store_true', help='also keep slower room solutions, which may exit into faster entries')
+  parser.add_argument('--workers', type=int, help='number of worker processes (default: search in this process)')
+  parser.add_argument('--cache', help='keep room subproblem solutions in this JSON file')
+  args = parser.parse_args()
+
+  rooms = [(utils.load_class(path), int(depth)) for path, depth in (room.rsplit(':', 1) for room in args.rooms)]
+  routes = search_route(rooms, args.level, args.loading_jank, args.top_k, args.complete, args.workers, args.cache)
+  if routes:
+    inputs, splits = routes[0]
+    print(f"frames: {len(inputs)} (per room: {splits})")
+    print(f"inputs: {inputs}")
+  else:
+    print('no route found')
@@ -3,8 +3,15 @@ from Carts.Celeste import Celeste
 import CelesteUtils as utils
 
 import time
-import copy
 import math
+import multiprocessing
+import collections
+import heapq
+import hashlib
+import inspect
+import sqlite3
+import json
+import os
 
 '''
 To define and run a search problem:
@@ -45,14 +52,312 @@ To define and run a search problem:
 3. Instantiate the class, and call instance.search(max_depth)
 
   > use optional argument complete=True to search up to max_depth, even if a solution has already been found
+  > use optional argument workers=N to spread the search over N processes
+    - each worker process creates its own instance of the class and calls init_state once, so init_state should be deterministic
+  > use optional argument tt_size=N to skip duplicate states already proven fruitless, remembering up to N states
+    - assumes the overridden methods only depend on the game state
+    - with complete=True, states are only skipped at the same remaining depth (fewer hits, but every solution is still found)
+  > use optional argument cache=path to keep states proven fruitless in an SQLite file, reused by reruns
+    - entries are keyed by problem_key (the map, max dashes, initial state and the problem class's code), so changing the problem starts afresh
+    - a rerun (e.g., with a larger max_depth, or after the job was killed) skips subtrees already proven fruitless at the same remaining depth
+  > use optional argument checkpoint=path to save the search position to a JSON file every checkpoint_every seconds (default 60) and after each depth
+    - call instance.resume(path) to continue a killed search from its last checkpoint (with the same options)
+    - with workers, checkpoints are only saved after each depth
+  > use optional argument solutions_file=path to append each solution to a file (one JSON list per line) as soon as it's found
+    - after resuming, solutions found between the last checkpoint and the kill are written again
+  > use optional argument merge_actions=True to only search one of the inputs that lead to the same state (the first one in allowable_actions order)
+    - e.g., dashes without a dash available, or jumps without a jump available
+    - the equivalent inputs of every frame of a solution are kept in instance.equivalents (in the same order as instance.solutions)
+    - use optional argument list_equivalent=True to also print them with each solution
+  > use optional argument observer=f to call f(stats) after each depth, with that depth's SearchStats
+    - the stats of every depth are also kept in instance.stats (see SearchStats.as_dict for a machine-readable form)
+
+  alternatively, call instance.search_bfs(max_depth) to search breadth-first, merging duplicate states
+    - finds one input sequence per distinct goal state, rather than every input sequence
+    - use optional argument beam_width=N to only keep the N states with the lowest h_cost at each depth (no longer guaranteed optimal)
+    - use optional argument complete=True to search up to max_depth, even if a solution has already been found
+
+  or call instance.search_astar(max_depth) to run an A* search guided by h_cost, merging duplicate states
+    - finds a single fastest solution
+    - use optional argument weight=w (> 1) to favor states with lower h_cost, finding a solution faster (at most w times slower than optimal)
+
+  or call instance.search_midpoint(max_depth) to enumerate states up to half the depth once (merging duplicates), then run IDDFS from that frontier
+    - suited to goal regions (e.g., reach certain coordinates with a dash available) that IDDFS would reach through the same first half many times
+    - finds the fastest solutions, one input sequence per distinct state on the frontier
+    - use optional argument split=d to enumerate up to depth d instead, and tt_size=N for a transposition table shared by the frontier's searches
+    - use optional argument coarse=True to also merge frontier states with the same coarse_key (player position, dashes and rounded speed; no longer guaranteed optimal)
 '''
 
+# bounded table of states proven fruitless, mapping state keys to the largest remaining depth searched without a solution
+# least recently used entries are evicted first
+# a goal must be reached with exactly 0 depth remaining, so no solution in d steps doesn't rule out one in fewer steps
+# this only matters once a solution has been found (any shorter one would have been found at an earlier depth),
+# so complete searches use exact=True, matching remaining depths exactly like SearchCache
+class TranspositionTable():
+  def __init__(self, max_entries, exact=False):
+    self.max_entries = max_entries
+    self.exact = exact
+    self.table = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  # check if a state was already proven fruitless with at least this much remaining depth (exactly this much if exact)
+  def is_fruitless(self, key, depth):
+    if self.exact:
+      key = (key, depth)
+    d = self.table.get(key)
+    if d is not None and depth <= d:
+      self.table.move_to_end(key)
+      self.hits += 1
+      return True
+    self.misses += 1
+    return False
+
+  # record that a state has no solution within depth steps
+  def store(self, key, depth):
+    if self.exact:
+      key = (key, depth)
+    self.table[key] = depth
+    self.table.move_to_end(key)
+    if len(self.table) > self.max_entries:
+      self.table.popitem(last=False)
+      self.evictions += 1
+
+  def __len__(self):
+    return len(self.table)
+
+  def __str__(self):
+    lookups = self.hits + self.misses
+    hit_rate = 100 * self.hits / lookups if lookups else 0
+    return f'entries: {len(self)}/{self.max_entries}, hits: {self.hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate), evictions: {self.evictions}'
+
+# on-disk table of (state hash, remaining depth) pairs proven fruitless, for one search problem
+# unlike the transposition table, depths are matched exactly (a goal must be reached with exactly 0 depth remaining)
+# writes are buffered and flushed every flush_every entries, and after each depth
+class SearchCache():
+  def __init__(self, path, problem, flush_every=10000):
+    self.problem = problem
+    self.flush_every = flush_every
+    self.pending = set()
+    self.hits = 0
+    self.misses = 0
+    self.db = sqlite3.connect(path, timeout=60)
+    self.db.execute('CREATE TABLE IF NOT EXISTS fruitless (problem TEXT, state TEXT, depth INTEGER, PRIMARY KEY (problem, state, depth)) WITHOUT ROWID')
+    self.db.commit()
+
+  # check if a state was already proven fruitless with this remaining depth
+  def is_fruitless(self, key, depth):
+    if (key, depth) in self.pending or \
+     self.db.execute('SELECT 1 FROM fruitless WHERE problem = ? AND state = ? AND depth = ?', (self.problem, key, depth)).fetchone():
+      self.hits += 1
+      return True
+    self.misses += 1
+    return False
+
+  # record that a state has no solution with depth steps remaining
+  def store(self, key, depth):
+    self.pending.add((key, depth))
+    if len(self.pending) >= self.flush_every:
+      self.flush()
+
+  def flush(self):
+    self.db.executemany('INSERT OR IGNORE INTO fruitless VALUES (?, ?, ?)', ((self.problem, key, depth) for key, depth in self.pending))
+    self.db.commit()
+    self.pending = set()
+
+  def close(self):
+    self.flush()
+    self.db.close()
+
+  def __str__(self):
+    lookups = self.hits + self.misses
+    hit_rate = 100 * self.hits / lookups if lookups else 0
+    return f'hits: {self.hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate)'
+
+# lower bounds on the frames needed to exit a room off the top, for every player position, with and without a dash
+# built backward from the exit over a relaxed movement model: every frame, the player may move to any position within
+# fast_reach (with a dash) or slow_reach (without one) px horizontally / up / down, as long as its hitbox is clear of solid tiles
+# (walls and floors are at least 8 px thick, so they can't be skipped). objects are ignored, except that a dash is regained
+# on the ground, at balloons, springs and fruits (anywhere if the room has platforms or flying fruits)
+class ExitDistances():
+  # px moved in one frame (dx, up, down), with speed rounding: dashes reach 7 px
+  fast_reach = (7, 7, 7)
+  slow_reach = (3, 4, 3)
+  # springs move the player up to 8 px in one frame, with or without a dash
+  spring_up = 8
+  # player positions covered: x in [-1, 121], y in [-5, 128] (y = -5 exits)
+  x0, y0, w, h = -1, -5, 123, 134
+
+  def __init__(self, game, objs):
+    solid = game.room_masks()[0]
+    free = [0] * self.h
+    refill = [0] * self.h
+    anywhere = any(type(o) in (game.platform, game.fly_fruit) for o in objs)
+    # areas where touching the top refills the dash, and areas where overlapping it does (fruits bob 2.5 px around their start)
+    ground = [self.grown_rect(o.x, o.y, o, 8) for o in objs if type(o) in (game.fall_floor, game.fake_wall)]
+    boosts = [self.grown_rect(o.x, o.start if type(o) == game.fruit else o.y, o, 4 if type(o) == game.fruit else 1)
+      for o in objs if type(o) in (game.balloon, game.spring, game.fruit)]
+    for j in range(self.h):
+      for i in range(self.w):
+        x, y = self.x0 + i, self.y0 + j
+        if game.tile_mask(x + 1, y + 3, 6, 5) & solid:
+          continue
+        free[j] |= 1 << i
+        if anywhere or game.tile_mask(x + 1, y + 4, 6, 5) & solid or \
+         any(self.overlaps(x, y + 1, r) for r in ground) or any(self.overlaps(x, y, r) for r in boosts):
+          refill[j] |= 1 << i
+    # frames by layer (0: without a dash, 1: with a dash), 255 for free positions that can't exit, 0 for solid ones
+    self.frames = [bytearray(self.w * self.h) for layer in range(2)]
+    for layer in self.frames:
+      for j in range(self.h):
+        for i in range(self.w):
+          if free[j] >> i & 1:
+            layer[j * self.w + i] = 255
+    fast_reach, slow_reach = self.fast_reach, self.slow_reach
+    if any(type(o) == game.spring for o in objs):
+      fast_reach = (fast_reach[0], max(fast_reach[1], self.spring_up), fast_reach[2])
+      slow_reach = (slow_reach[0], max(slow_reach[1], self.spring_up), slow_reach[2])
+    goal = [free[0]] + [0] * (self.h - 1)
+    fast = self.search(free, goal, fast_reach, self.frames[1])
+    slow_goal = [g | r & f for g, r, f in zip(goal, refill, fast[0])]
+    self.search(free, slow_goal, slow_reach, self.frames[0], [[r & f for r, f in zip(refill, rows)] for rows in fast])
+
+  # an object's hitbox at (x, y), grown by margin px on every side, as (left, top, right, bottom)
+  def grown_rect(self, x, y, o, margin):
+    return (x + o.hitbox.x - margin, y + o.hitbox.y - margin, x + o.hitbox.x + o.hitbox.w + margin, y + o.hitbox.y + o.hitbox.h + margin)
+
+  # does the player's hitbox at (x, y) overlap a rect
+  def overlaps(self, x, y, rect):
+    return x + 7 > rect[0] and y + 8 > rect[1] and x + 1 < rect[2] and y + 3 < rect[3]
+
+  # breadth-first search backward from the goal rows (bitmasks of positions by row), one frame per step
+  # entries[k] are extra positions reachable within k frames; returns the rows reached within each number of frames
+  def search(self, free, goal, reach, frames, entries=()):
+    dx, up, down = reach
+    full = (1 << self.w) - 1
+    reached, history, k = goal, [goal], 0
+    while True:
+      for j, row in enumerate(reached):
+        while row:
+          bit = row & -row
+          i = bit.bit_length() - 1
+          if frames[j * self.w + i] == 255:
+            frames[j * self.w + i] = k
+          row ^= bit
+      k += 1
+      spread = []
+      for row in reached:
+        wide = row
+        for d in range(1, dx + 1):
+          wide |= row << d | row >> d
+        spread.append(wide & full)
+      grown = []
+      for j in range(self.h):
+        row = reached[j]
+        for q in range(max(0, j - up), min(self.h, j + down + 1)):
+          row |= spread[q]
+        grown.append(row & free[j] | (entries[min(k, len(entries) - 1)][j] if entries else 0))
+      if grown == reached and k >= len(entries):
+        return history
+      reached = grown
+      history.append(reached)
+
+  # lower bound on frames to exit for a player
+  def frames_to_exit(self, player):
+    i, j = int(min(121, max(-1, player.x))) - self.x0, player.y - self.y0
+    if j < 0 or j >= self.h:
+      return 0
+    dash = player.djump > 0 or player.dash_time > 0 or abs(player.spd.x) > 2 or player.spd.y < -3
+    frames = self.frames[1 if dash else 0][j * self.w + i]
+    return math.inf if frames == 255 else frames
+
+# exit distances by (room's solid tiles, objects they depend on)
+_exit_distances = {}
+
+# node counters and timings of one IDDFS depth
+class SearchStats():
+  def __init__(self, depth):
+    self.depth = depth
+    self.visited = 0 # nodes reached
+    self.expanded = 0 # nodes whose actions were tried
+    self.generated = 0 # transitions performed
+    self.pruned_h_cost = 0 # nodes cut off by h_cost
+    self.pruned_rip = 0 # nodes cut off by an infinite h_cost (default: is_rip)
+    self.pruned_tt = 0 # nodes skipped by the transposition table
+    self.pruned_cache = 0 # nodes skipped by the on-disk search cache
+    self.merged = 0 # actions skipped for leading to the same state as an earlier action
+    self.solutions = 0
+    self.time_transition = 0.0
+    self.time_get_actions = 0.0
+    self.time_h_cost = 0.0
+    self.elapsed = 0.0
+
+  # average number of actions tried per expanded node
+  @property
+  def branching_factor(self):
+    return self.generated / self.expanded if self.expanded else 0.0
+
+  # add the counters of another SearchStats (e.g., from a parallel worker)
+  def merge(self, other):
+    for k, v in vars(other).items():
+      if k not in ('depth', 'elapsed'):
+        setattr(self, k, getattr(self, k) + v)
+
+  def as_dict(self):
+    return {**vars(self), 'branching_factor': self.branching_factor}
+
+  def __str__(self):
+    return f'visited: {self.visited}, expanded: {self.expanded}, pruned (h_cost): {self.pruned_h_cost}, pruned (rip): {self.pruned_rip}, ' \
+      f'pruned (transposition table): {self.pruned_tt}, pruned (cache): {self.pruned_cache}, merged actions: {self.merged}, branching factor: {self.branching_factor:.2f}\n' \
+      f'  time in transition: {self.time_transition:.2f} [s], get_actions: {self.time_get_actions:.2f} [s], h_cost: {self.time_h_cost:.2f} [s]'
+
+# per-process search instance used by parallel search workers
+_searcher = None
+
+def _init_worker(cls, cart, tt_size, cache=None, problem=None, merge_actions=False, complete=False):
+  global _searcher
+  _searcher = cls(cart)
+  _searcher.verbose = False
+  _searcher.tt = TranspositionTable(tt_size, exact=complete) if tt_size else None
+  _searcher.cache = SearchCache(cache, problem) if cache else None
+  _searcher.merge_actions = merge_actions
+  _searcher.p8.game.objects = _searcher.init_state()
+
+def _search_subtree(task):
+  state, depth, inputs, equivalents = task
+  _searcher.solutions = []
+  _searcher.equivalents = []
+  _searcher.equivalent_path = list(equivalents)
+  _searcher.depth_stats = SearchStats(depth)
+  _searcher.p8.game.load_state(state)
+  found = _searcher.iddfs(state, depth, inputs)
+  if _searcher.cache is not None:
+    _searcher.cache.flush()
+  return found, _searcher.solutions, _searcher.equivalents, _searcher.depth_stats
+
 class Searcheline():
   def __init__(self, cart=None):
     self.solutions = []
+    self.verbose = True
+    self.tt = None
+    self.cache = None
+    self.checkpoint = None
+    self.path = []
+    self.resume_path = None
+    self.solutions_file = None
+    self.merge_actions = False
+    self.list_equivalent = False
+    self.equivalents = []
+    self.equivalent_path = []
+    self.stats = []
+    self.depth_stats = SearchStats(0)
+    # memoized collision_probes results, cleared once probe_memo_size entries are reached
+    self.probe_memo = {}
+    self.probe_memo_size = 100000
     self.p8 = PICO8(Celeste if cart == None else cart)
     utils.enable_loop_mode(self.p8)
-    
+
 
   # initial state (list of game objects) to search from
   # must override this
@@ -96,6 +401,25 @@ class Searcheline():
     else:
       return self.exit_heuristic(self.find_player(objs))
 
+  # alternative h_cost for exit goals: the larger of exit_heuristic and a terrain-aware bound (see ExitDistances)
+  # to use it, override h_cost to return self.reachability_h_cost(objs)
+  def reachability_h_cost(self, objs):
+    if self.is_rip(objs):
+      return math.inf
+    player = self.find_player(objs)
+    return max(self.exit_heuristic(player), self.exit_distances(objs).frames_to_exit(player))
+
+  # exit distances of the current room, shared by every search with the same solid tiles and objects
+  def exit_distances(self, objs):
+    game = self.p8.game
+    key = (game.room_masks()[0],) + tuple((type(o).__name__,) if type(o) in (game.platform, game.fly_fruit) else
+      (type(o).__name__, o.x, o.start if type(o) == game.fruit else o.y) for o in objs
+      if type(o) in (game.platform, game.fly_fruit, game.fall_floor, game.fake_wall, game.balloon, game.spring, game.fruit))
+    distances = _exit_distances.get(key)
+    if distances == None:
+      distances = _exit_distances[key] = ExitDistances(game, objs)
+    return distances
+
   # rip conditions (situations not worth considering further)
   # default: player dies
   def is_rip(self, objs):
@@ -117,56 +441,449 @@ class Searcheline():
     if p.dash_time != 0: return [0b000000]
     return self.allowable_actions(objs, p, *self.action_restrictions(objs, p))
 
-  # apply inputs to a state, disable freeze and respawn globals as one game instance is shared
-  def transition(self, objs, a):
-    self.p8.game.objects = copy.deepcopy(objs)
+  # apply every action to a state snapshot, merging actions that lead to the same state and freeze (the first action of each group is kept)
+  # returns a list of (action, equivalent actions, new state, freeze) in action order
+  def merged_transitions(self, state, actions):
+    children = {}
+    for a in actions:
+      new_state, freeze = self.transition(state, a)
+      key = (self.state_key(new_state), freeze)
+      if key in children:
+        children[key][1].append(a)
+      else:
+        children[key] = (a, [a], new_state, freeze)
+    return list(children.values())
+
+  # apply inputs to a state snapshot, disable freeze and respawn globals (freeze frames are skipped by the search)
+  # leaves the game instance in the resulting state, and returns its snapshot
+  def transition(self, state, a):
+    self.p8.game.load_state(state)
     self.p8.set_btn_state(a)
     self.p8.step()
     freeze = self.p8.game.freeze
     self.p8.game.freeze = 0
     self.p8.game.delay_restart = 0
-    return self.p8.game.objects, freeze
+    return self.p8.game.save_state(), freeze
 
-  # IDDFS
+  # IDDFS (the game instance holds the given state on entry)
+  # with checkpointing, self.path holds the action indices leading to the current node
+  # when resuming, self.resume_path holds the indices leading to the checkpointed node (subtrees to its left are skipped)
   def iddfs(self, state, depth, inputs):
-    if depth == 0 and self.is_goal(state):
-      self.solutions.append(inputs)
-      print(f"  inputs: {inputs}\n  frames: {len(inputs) - 1}")
+    stats = self.depth_stats
+    stats.visited += 1
+    if self.checkpoint is not None and time.time() >= self.next_checkpoint:
+      self.save_checkpoint(self.path)
+    # nodes on the way to the checkpointed node are only partially searched, so they aren't recorded as fruitless
+    partial = self.resume_path is not None
+    objs = self.p8.game.objects
+    if depth == 0 and self.is_goal(objs):
+      self.add_solution(inputs)
       return True
     else:
+      if self.tt is not None and depth > 0:
+        key = self.state_key(state)
+        if self.tt.is_fruitless(key, depth):
+          stats.pruned_tt += 1
+          return False
+      if self.cache is not None and depth > 0:
+        cache_key = self.p8.game.state_hash(self.state_key(state))
+        if self.cache.is_fruitless(cache_key, depth):
+          stats.pruned_cache += 1
+          return False
       optimal_depth = False
-      if depth > 0 and self.h_cost(state) <= depth:
-        for a in self.get_actions(state):
-          new_state, freeze = self.transition(state, a)
-          done = self.iddfs(new_state, depth - 1 - freeze, inputs + [a] + [0] * freeze)
-          if done:
-            optimal_depth = True
+      if depth > 0:
+        timer = time.perf_counter()
+        h = self.h_cost(objs)
+        stats.time_h_cost += time.perf_counter() - timer
+        if h == math.inf:
+          stats.pruned_rip += 1
+        elif h > depth:
+          stats.pruned_h_cost += 1
+        else:
+          timer = time.perf_counter()
+          actions = self.get_actions(objs)
+          stats.time_get_actions += time.perf_counter() - timer
+          stats.expanded += 1
+          stats.generated += len(actions)
+          if self.merge_actions:
+            timer = time.perf_counter()
+            children = self.merged_transitions(state, actions)
+            stats.time_transition += time.perf_counter() - timer
+            stats.merged += len(actions) - len(children)
+            actions = children
+          for i in range(self.resume_index(), len(actions)):
+            if self.merge_actions:
+              a, group, new_state, freeze = actions[i]
+              self.p8.game.load_state(new_state)
+              self.equivalent_path.extend([tuple(group)] + [(0,)] * freeze)
+            else:
+              a = actions[i]
+              timer = time.perf_counter()
+              new_state, freeze = self.transition(state, a)
+              stats.time_transition += time.perf_counter() - timer
+            if self.checkpoint is not None:
+              self.path.append(i)
+            done = self.iddfs(new_state, depth - 1 - freeze, inputs + [a] + [0] * freeze)
+            if self.checkpoint is not None:
+              self.path.pop()
+              self.resume_path = None
+            if self.merge_actions:
+              del self.equivalent_path[len(inputs):]
+            if done:
+              optimal_depth = True
+      if self.tt is not None and depth > 0 and not optimal_depth and not partial:
+        self.tt.store(key, depth)
+      if self.cache is not None and depth > 0 and not optimal_depth and not partial:
+        self.cache.store(cache_key, depth)
       return optimal_depth
 
+  # index of the first action to search at the current node (skips actions searched before the checkpoint when resuming)
+  def resume_index(self):
+    if self.resume_path is None:
+      return 0
+    if len(self.path) < len(self.resume_path):
+      return self.resume_path[len(self.path)]
+    # reached the checkpointed node
+    self.resume_path = None
+    return 0
+
+  # save the search position (depth, action indices of the next node to search, solutions so far) and options
+  def save_checkpoint(self, path):
+    checkpoint = {
+      'depth': self.depth_stats.depth,
+      'path': list(path),
+      'found': self.depth_stats.solutions > 0,
+      'solutions': self.solutions,
+      'equivalents': self.equivalents,
+      'options': self.options
+    }
+    with open(self.checkpoint + '.tmp', 'w') as f:
+      json.dump(checkpoint, f)
+    os.replace(self.checkpoint + '.tmp', self.checkpoint)
+    self.next_checkpoint = time.time() + self.checkpoint_every
+
+  # continue a search from a checkpoint file saved by search(..., checkpoint=path)
+  def resume(self, checkpoint, observer=None):
+    with open(checkpoint) as f:
+      resume_from = json.load(f)
+    return self.search(observer=observer, checkpoint=checkpoint, resume_from=resume_from, **resume_from['options'])
+
+  # expand the first plies of the IDDFS tree, collecting the subtrees below them (state, depth, inputs) in search order
+  def split(self, state, depth, inputs, plies, tasks, equivalents=()):
+    if plies == 0 or depth <= 0:
+      tasks.append((state, depth, inputs, equivalents))
+    else:
+      objs = self.p8.game.objects
+      if self.h_cost(objs) <= depth:
+        if self.merge_actions:
+          for a, group, new_state, freeze in self.merged_transitions(state, self.get_actions(objs)):
+            self.p8.game.load_state(new_state)
+            self.split(new_state, depth - 1 - freeze, inputs + [a] + [0] * freeze, plies - 1, tasks,
+              equivalents + (tuple(group),) + ((0,),) * freeze)
+        else:
+          for a in self.get_actions(objs):
+            new_state, freeze = self.transition(state, a)
+            self.split(new_state, depth - 1 - freeze, inputs + [a] + [0] * freeze, plies - 1, tasks)
+
+  # IDDFS with the subtrees spread over a pool of worker processes, solutions are merged in search order
+  def parallel_iddfs(self, pool, state, depth, workers):
+    for plies in range(1, depth + 1):
+      tasks = []
+      self.p8.game.load_state(state)
+      self.split(state, depth, [], plies, tasks)
+      if not tasks or len(tasks) >= 8 * workers:
+        break
+    optimal_depth = False
+    for found, solutions, equivalents, stats in pool.imap(_search_subtree, tasks):
+      for inputs, eq in zip(solutions, equivalents if self.merge_actions else [None] * len(solutions)):
+        self.equivalent_path = eq
+        self.add_solution(inputs)
+      self.depth_stats.merge(stats)
+      optimal_depth = optimal_depth or found
+    return optimal_depth
+
   # run IDDFS routine
-  def search(self, max_depth, complete=False):
+  def search(self, max_depth, complete=False, workers=None, tt_size=None, observer=None, cache=None,
+    checkpoint=None, checkpoint_every=60, solutions_file=None, merge_actions=False, list_equivalent=False, resume_from=None):
+    self.options = {'max_depth': max_depth, 'complete': complete, 'workers': workers, 'tt_size': tt_size, 'cache': cache,
+      'checkpoint_every': checkpoint_every, 'solutions_file': solutions_file, 'merge_actions': merge_actions, 'list_equivalent': list_equivalent}
+    self.merge_actions, self.list_equivalent = merge_actions, list_equivalent
+    self.equivalents = [] if resume_from == None else resume_from.get('equivalents', [])
+    self.equivalent_path = []
+    self.solutions = [] if resume_from == None else resume_from['solutions']
+    self.checkpoint, self.checkpoint_every = checkpoint, checkpoint_every
+    self.next_checkpoint = time.time() + checkpoint_every
+    self.path = []
+    self.resume_path = None if resume_from == None else resume_from['path'] or None
+    self.solutions_file = open(solutions_file, 'a') if solutions_file else None
+    self.stats = []
+    self.tt = TranspositionTable(tt_size, exact=complete) if tt_size else None
+    timer = time.time()
+    self.p8.game.objects = self.init_state()
+    state = self.p8.game.save_state()
+    problem = self.problem_key(state) if cache else None
+    self.cache = SearchCache(cache, problem) if cache else None
+    pool = multiprocessing.Pool(workers, _init_worker, (type(self), self.p8._cart, tt_size, cache, problem, merge_actions, complete)) if workers and workers > 1 else None
+    print('searching...' if resume_from == None else f"resuming from depth {resume_from['depth']}...")
+    try:
+      for depth in range(1 if resume_from == None else resume_from['depth'], max_depth + 1):
+        print(f"depth {depth}...")
+        self.p8.game.load_state(state)
+        self.depth_stats = SearchStats(depth)
+        depth_timer = time.perf_counter()
+        if pool:
+          done = self.parallel_iddfs(pool, state, depth, workers)
+        else:
+          done = self.iddfs(state, depth, [])
+        # solutions found at this depth before the checkpoint
+        if resume_from != None and depth == resume_from['depth']:
+          done = done or resume_from['found']
+        done = done and not complete
+        self.depth_stats.elapsed = time.perf_counter() - depth_timer
+        self.stats.append(self.depth_stats)
+        if observer:
+          observer(self.depth_stats)
+        print(f"  {self.depth_stats}")
+        print(f"  elapsed time: {time.time() - timer:.2f} [s]")
+        if self.tt is not None and not pool:
+          print(f"  transposition table: {self.tt}")
+        if self.cache is not None:
+          self.cache.flush()
+          if not pool:
+            print(f"  search cache: {self.cache}")
+        if self.checkpoint is not None:
+          # the next depth from the start (or nothing left to search)
+          self.depth_stats = SearchStats(depth + 1 if not done else max_depth + 1)
+          self.save_checkpoint([])
+        if done:
+          break
+    finally:
+      if pool:
+        pool.terminate()
+      if self.cache is not None:
+        self.cache.close()
+        self.cache = None
+      if self.solutions_file is not None:
+        self.solutions_file.close()
+        self.solutions_file = None
+      self.checkpoint = None
+    return self.solutions
+
+  # breadth-first search, merging duplicate states (only the earliest arrival at a state is kept)
+  def search_bfs(self, max_depth, beam_width=None, complete=False):
     self.solutions = []
+    self.merge_actions = False
+    self.stats = []
     timer = time.time()
-    state = self.init_state()
+    self.p8.game.objects = self.init_state()
+    state = self.p8.game.save_state()
+    # layers of states by depth, each mapping state keys to (state, inputs, h_cost)
+    layers = collections.defaultdict(dict)
+    layers[0][self.state_key(state)] = (state, [], self.node_h_cost(self.p8.game.objects))
+    best_depth = {self.state_key(state): 0}
     print('searching...')
-    for depth in range(1, max_depth + 1):
+    for depth in range(max_depth + 1):
+      layer = list(layers.pop(depth, {}).values())
+      if beam_width and len(layer) > beam_width:
+        layer = sorted(layer, key=lambda node: node[2])[:beam_width]
+      print(f"depth {depth}... ({len(layer)} states)")
+      self.expand_layer(layer, depth, max_depth, layers, best_depth, self.state_key)
+      print(f"  elapsed time: {time.time() - timer:.2f} [s]")
+      if self.solutions and not complete:
+        break
+    return self.solutions
+
+  # expand one layer of a breadth-first search, recording goal states as solutions and collecting the stats of its depth
+  # layers map depths to {key: (state, inputs, h_cost)}, and best_depth maps keys to the depth their state is kept at
+  # successors are merged by key(state) (computed with the successor loaded), keeping the one reached in the fewest frames
+  # with keep=True, non-goal states are put back into their layer instead of being expanded
+  def expand_layer(self, layer, depth, max_depth, layers, best_depth, key, keep=False):
+    self.depth_stats = SearchStats(depth)
+    self.depth_stats.visited = len(layer)
+    for state, inputs, h in layer:
+      self.p8.game.load_state(state)
+      objs = self.p8.game.objects
+      if self.is_goal(objs):
+        self.add_solution(inputs)
+        continue
+      if keep:
+        layers[depth][key(state)] = (state, inputs, h)
+        continue
+      if depth + h > max_depth:
+        self.depth_stats.pruned_h_cost += 1
+        continue
+      actions = self.get_actions(objs)
+      self.depth_stats.expanded += 1
+      self.depth_stats.generated += len(actions)
+      for a in actions:
+        new_state, freeze = self.transition(state, a)
+        new_depth = depth + 1 + freeze
+        new_key = key(new_state)
+        if new_depth > max_depth or best_depth.get(new_key, math.inf) <= new_depth:
+          continue
+        new_h = self.node_h_cost(self.p8.game.objects)
+        if new_depth + new_h > max_depth:
+          continue
+        if new_key in best_depth:
+          layers[best_depth[new_key]].pop(new_key, None)
+        best_depth[new_key] = new_depth
+        layers[new_depth][new_key] = (new_state, inputs + [a] + [0] * freeze, new_h)
+    self.stats.append(self.depth_stats)
+
+  # A* search, prioritizing states by frames taken + weight * h_cost
+  def search_astar(self, max_depth, weight=1.0):
+    self.solutions = []
+    self.merge_actions = False
+    timer = time.time()
+    self.p8.game.objects = self.init_state()
+    state = self.p8.game.save_state()
+    # open states (priority, -frames taken, insertion order, frames taken, state, inputs), ties go to deeper states
+    counter = 0
+    queue = [(weight * self.node_h_cost(self.p8.game.objects), 0, counter, 0, state, [])]
+    best_depth = {self.state_key(state): 0}
+    expanded = 0
+    print('searching...')
+    while queue:
+      _, _, _, depth, state, inputs = heapq.heappop(queue)
+      if best_depth[self.state_key(state)] < depth:
+        continue
+      self.p8.game.load_state(state)
+      objs = self.p8.game.objects
+      if self.is_goal(objs):
+        self.add_solution(inputs)
+        break
+      expanded += 1
+      for a in self.get_actions(objs):
+        new_state, freeze = self.transition(state, a)
+        new_depth = depth + 1 + freeze
+        key = self.state_key(new_state)
+        if new_depth > max_depth or best_depth.get(key, math.inf) <= new_depth:
+          continue
+        h = self.node_h_cost(self.p8.game.objects)
+        if new_depth + h > max_depth:
+          continue
+        best_depth[key] = new_depth
+        counter += 1
+        heapq.heappush(queue, (new_depth + weight * h, -new_depth, counter, new_depth, new_state, inputs + [a] + [0] * freeze))
+    print(f"  expanded states: {expanded}\n  elapsed time: {time.time() - timer:.2f} [s]")
+    return self.solutions
+
+  # two-phase search: states up to the split depth are enumerated once, merging duplicates, then the rest is searched by IDDFS from that frontier
+  # (IDDFS would re-expand the first half on every depth, this splits the work between a stored frontier and the deepening)
+  # like search_bfs, only the earliest arrival at a state is kept
+  def search_midpoint(self, max_depth, split=None, complete=False, coarse=False, tt_size=None, observer=None):
+    self.solutions = []
+    self.merge_actions = False
+    self.checkpoint, self.resume_path, self.path = None, None, []
+    self.stats = []
+    self.tt = TranspositionTable(tt_size, exact=complete) if tt_size else None
+    split = max_depth // 2 if split == None else min(split, max_depth)
+    timer = time.time()
+    self.p8.game.objects = self.init_state()
+    state = self.p8.game.save_state()
+    # forward half: layers of states by depth, each mapping state keys (or coarse keys) to (state, inputs, h_cost)
+    layers = collections.defaultdict(dict)
+    frontier_key = lambda state: self.coarse_key(self.p8.game.objects) if coarse else self.state_key(state)
+    layers[0][frontier_key(state)] = (state, [], self.node_h_cost(self.p8.game.objects))
+    best_depth = {frontier_key(state): 0}
+    print(f'searching up to depth {split}...')
+    for depth in range(split + 1):
+      layer = list(layers.pop(depth, {}).values())
+      # states at the split depth are the frontier, searched by the second half
+      self.expand_layer(layer, depth, max_depth, layers, best_depth, frontier_key, keep=depth == split)
+      if observer:
+        observer(self.depth_stats)
+      if self.solutions and not complete:
+        print(f"  elapsed time: {time.time() - timer:.2f} [s]")
+        return self.solutions
+    # frontier states (at the split depth, or past it after freeze frames) as (depth, h_cost, state, inputs), most promising first
+    frontier = sorted(((depth, h, state, inputs) for depth, layer in layers.items() for state, inputs, h in layer.values()), key=lambda node: node[0] + node[1])
+    print(f"  frontier: {len(frontier)} states")
+    print(f"  elapsed time: {time.time() - timer:.2f} [s]")
+    # second half: deepen from the frontier
+    for depth in range(split + 1, max_depth + 1):
       print(f"depth {depth}...")
-      done = self.iddfs(state, depth, []) and not complete
+      self.depth_stats = SearchStats(depth)
+      depth_timer = time.perf_counter()
+      done = False
+      for node_depth, h, state, inputs in frontier:
+        if node_depth + h > depth:
+          # the frontier is sorted, no other state can reach the goal at this depth
+          break
+        self.p8.game.load_state(state)
+        done = self.iddfs(state, depth - node_depth, inputs) or done
+      done = done and not complete
+      self.depth_stats.elapsed = time.perf_counter() - depth_timer
+      self.stats.append(self.depth_stats)
+      if observer:
+        observer(self.depth_stats)
+      print(f"  {self.depth_stats}")
       print(f"  elapsed time: {time.time() - timer:.2f} [s]")
       if done:
         break
     return self.solutions
 
+  # coarse player state used by search_midpoint(coarse=True) to merge frontier states: position, dashes left and speed rounded to whole pixels
+  # states without a player are only merged with identical states
+  def coarse_key(self, objs):
+    p = self.find_player(objs)
+    if p == None:
+      return self.state_key(self.p8.game.save_state())
+    return (p.x, p.y, p.djump, round(p.spd.x), round(p.spd.y))
+
+  # h_cost of a search node, goal states are never pruned
+  def node_h_cost(self, objs):
+    return 0 if self.is_goal(objs) else self.h_cost(objs)
+
+  # record a found solution
+  def add_solution(self, inputs):
+    self.solutions.append(inputs)
+    self.depth_stats.solutions += 1
+    if self.solutions_file is not None:
+      self.solutions_file.write(json.dumps(inputs) + '\n')
+      self.solutions_file.flush()
+    if self.merge_actions:
+      self.equivalents.append([list(group) for group in self.equivalent_path])
+    if self.verbose:
+      print(f"  inputs: {inputs}\n  frames: {len(inputs) - 1}")
+      if self.merge_actions and self.list_equivalent:
+        print(f"  equivalent inputs: {self.equivalents[-1]}")
+
+  # key identifying the search problem in the on-disk cache: the map, max dashes, initial state (by state_key) and the code of the problem class
+  # override if the problem depends on anything else (e.g., settings passed to the instance)
+  def problem_key(self, state):
+    key = hashlib.blake2b(digest_size=16)
+    key.update(self.p8.save_map())
+    key.update(str(self.p8.game.max_djump).encode())
+    key.update(self.p8.game.state_hash(self.state_key(state)).encode())
+    for cls in type(self).__mro__:
+      if cls == Searcheline:
+        break
+      try:
+        key.update(inspect.getsource(cls).encode())
+      except (OSError, TypeError):
+        key.update(cls.__qualname__.encode())
+    return key.hexdigest()
+
+  # key identifying a state snapshot for duplicate detection (ignores the frame counter, which doesn't affect the game)
+  def state_key(self, state):
+    return state[1:]
+
   # find player in list of objects (override if player will be at a known position in the object list)
   def find_player(self, objs):
-    for o in objs:
-      if type(o) == self.p8.game.player:
-        return o
+    return self.find_first(objs, self.p8.game.player)
 
   # find player_spawn in list of objects (override if player_spawn will be at a known position in the object list)
   def find_player_spawn(self, objs):
+    return self.find_first(objs, self.p8.game.player_spawn)
+
+  # first object of a type in list of objects, looked up through the game's type registry for its own object list
+  def find_first(self, objs, obj_type):
+    if objs is self.p8.game.objects:
+      found = self.p8.game.type_registry.get(obj_type)
+      return found[0] if found else None
     for o in objs:
-      if type(o) == self.p8.game.player_spawn:
+      if type(o) == obj_type:
         return o
 
   # compute the player's next displacement to check if a jump/dash will be available next frame
@@ -180,12 +897,37 @@ class Searcheline():
 
   # compute basic action restrictions (can move horizontally, can jump, can dash)
   def action_restrictions(self, objs, player):
-    dx, dy = self.compute_displacement(player)
     h_movement = abs(player.spd.x) <= 1
-    can_jump = not player.p_jump and (player.grace - 1 > 0 or player.is_solid(-3 + dx, dy) or player.is_solid(3 + dx, dy) or player.is_solid(dx, 1 + dy))
-    can_dash = player.djump > 0 or player.is_solid(dx, 1 + dy) or player.check(self.p8.game.balloon, 0, 0) or player.check(self.p8.game.fruit, 0, 0) or player.check(self.p8.game.fly_fruit, 0, 0)
+    # collisions only matter for a jump without grace frames, or a dash without dashes left
+    probe_jump = not player.p_jump and player.grace - 1 <= 0
+    probe_dash = player.djump <= 0
+    jump_probe, dash_probe = self.collision_probes(player, probe_jump, probe_dash) if probe_jump or probe_dash else (False, False)
+    can_jump = not player.p_jump and (player.grace - 1 > 0 or jump_probe)
+    can_dash = player.djump > 0 or dash_probe
     return h_movement, can_jump, can_dash
 
+  # collisions after the player's next displacement: (next to a wall or the ground, on the ground or touching a dash refill)
+  # only the requested probes are computed, the others are False
+  # memoized by the player's position and speed, the room's solid tiles and the objects that can collide with the player
+  def collision_probes(self, player, probe_jump=True, probe_dash=True):
+    g = self.p8.game
+    key = (player.x, player.y, player.rem.x, player.rem.y, player.spd.x, player.spd.y, probe_jump, probe_dash, g.room_masks()[0])
+    if not g.player_only:
+      key += tuple(tuple((o.x, o.y, o.collideable) for o in g.type_registry.get(t, ()))
+        for t in (g.platform, g.fall_floor, g.fake_wall, g.balloon, g.fruit, g.fly_fruit))
+    probes = self.probe_memo.get(key)
+    if probes is None:
+      if len(self.probe_memo) >= self.probe_memo_size:
+        self.probe_memo.clear()
+      dx, dy = self.compute_displacement(player)
+      if probe_jump:
+        wall_left, wall_right, ground = player.probe_solid(((-3 + dx, dy), (3 + dx, dy), (dx, 1 + dy)))
+      else:
+        ground = player.is_solid(dx, 1 + dy)
+      refill = probe_dash and not ground and not g.player_only and any(player.check(t, 0, 0) for t in (g.balloon, g.fruit, g.fly_fruit))
+      probes = self.probe_memo[key] = (bool(probe_jump and (wall_left or wall_right or ground)), bool(probe_dash and (ground or refill)))
+    return probes
+
   # translate a list of inputs into english
   def inputs_to_english(self, inputs):
     action_dict = {
@@ -0,0 +1,38 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+from CelesteBatch import CelesteBatch
+import CelesteUtils as utils
+
+import random
+
+actions = [0, 1, 2, 4, 8, 16, 17, 18, 20, 32, 33, 34, 36, 37, 38, 40, 41, 42, 48]
+
+# a room with only the player, springs and balloons left, the player spawned
+def batch_room(level_id):
+  p8 = PICO8(Celeste)
+  utils.load_room(p8, level_id)
+  g = p8.game
+  for t in (g.fall_floor, g.fake_wall, g.platform, g.fruit, g.fly_fruit, g.key, g.chest):
+    utils.suppress_object(p8, t)
+  utils.skip_player_spawn(p8)
+  return p8
+
+def random_inputs(seed, n, frames):
+  rng = random.Random(seed)
+  return [[rng.choice(actions) if rng.random() < 0.4 else rng.choice([0, 1, 2]) for f in range(frames)] for i in range(n)]
+
+def test_batch_matches_game():
+  # terrain only, a balloon, and springs with a balloon
+  for level_id in (0, 5, 7):
+    p8 = batch_room(level_id)
+    state = p8.game.save_state()
+    engine = CelesteBatch(p8)
+    assert engine.verify(random_inputs(level_id, 20, 150)) == []
+    assert p8.game.save_state() == state
+
+def test_verify_reports_mismatches():
+  p8 = batch_room(0)
+  engine = CelesteBatch(p8)
+  # without terrain, the batch engine's player starts falling off the floor
+  engine.solid[:] = False
+  assert engine.verify([[0] * 30, [0] * 30]) == [(0, 0, 'spd_y', 0.0, 0.105), (1, 0, 'spd_y', 0.0, 0.105)]
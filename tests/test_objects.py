@@ -0,0 +1,65 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+import CelesteUtils as utils
+
+import copy
+import pickle
+
+def spawned_room(level_id):
+  p8 = PICO8(Celeste)
+  utils.load_room(p8, level_id)
+  utils.skip_player_spawn(p8)
+  return p8
+
+def test_in_place_edits_update_registry():
+  p8 = spawned_room(20)
+  g = p8.game
+  p = g.get_player()
+  g.objects.remove(p)
+  assert g.get_player() == None
+  g.objects.append(p)
+  assert g.get_player() is p
+  assert g.object_index[p] == len(g.objects) - 1
+
+def test_place_maddy_replaces_player():
+  p8 = spawned_room(0)
+  utils.place_maddy(p8, 40, 64)
+  players = [o for o in p8.game.objects if type(o) == p8.game.player]
+  assert len(players) == 1 and p8.game.get_player() is players[0]
+  assert (players[0].x, players[0].y) == (40, 64)
+
+def test_copied_objects_round_trip():
+  p8 = spawned_room(20)
+  g = p8.game
+  state = g.save_state()
+  for copied in (copy.deepcopy(list(g.objects)), copy.deepcopy(g.objects), pickle.loads(pickle.dumps(g.objects))):
+    assert type(copied) == list
+    assert [o.save_state() for o in copied] == [o.save_state() for o in g.objects]
+    # copies are detached from the game until they're assigned to it
+    assert all(o.g == None for o in copied)
+    g.objects = copied
+    assert all(o.g is g for o in copied)
+    assert g.save_state() == state
+
+def test_copied_player_round_trip():
+  p8 = spawned_room(20)
+  g = p8.game
+  p = g.get_player()
+  for copied in (copy.deepcopy(p), pickle.loads(pickle.dumps(p))):
+    assert copied.save_state() == p.save_state()
+    assert copied.g == None
+
+def test_copies_step_like_the_original():
+  p8 = spawned_room(20)
+  g = p8.game
+  inputs = [2, 2, 18, 2, 38, 0, 0, 0, 0, 2, 2]
+  objs = copy.deepcopy(g.objects)
+  for a in inputs:
+    p8.set_btn_state(a)
+    p8.step()
+  state = g.save_state()
+  g.objects = objs
+  for a in inputs:
+    p8.set_btn_state(a)
+    p8.step()
+  assert g.save_state()[1:] == state[1:]
@@ -0,0 +1,31 @@
+from PICO8 import PICO8
+from Carts.Celeste import Celeste
+
+import pytest
+
+def test_memory_is_read_only():
+  p8 = PICO8(Celeste)
+  with pytest.raises(TypeError):
+    p8.memory[p8.map_addr(0, 0)] = 32
+
+def test_mset_updates_tile_masks():
+  p8 = PICO8(Celeste)
+  g = p8.game
+  g.load_room(0, 0)
+  x, y = next((x, y) for y in range(16) for x in range(16) if not g.tile_flag_at(x * 8, y * 8, 8, 8, 0))
+  p8.mset(x, y, 32)
+  assert g.tile_flag_at(x * 8, y * 8, 8, 8, 0)
+
+def test_load_map_round_trip():
+  p8 = PICO8(Celeste)
+  original = p8.save_map()
+  p8.mset(3, 3, 32)
+  p8.load_map(original)
+  assert p8.save_map() == original
+
+def test_load_map_rejects_wrong_length():
+  p8 = PICO8(Celeste)
+  flags = bytes(p8.memory[0x3000:0x3100])
+  with pytest.raises(ValueError):
+    p8.load_map(p8.save_map()[:-100])
+  assert len(p8.memory) == 0x8000 and bytes(p8.memory[0x3000:0x3100]) == flags
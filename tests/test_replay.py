@@ -0,0 +1,11 @@
+from Replay import read_inputs
+
+def test_read_inputs_skips_labelled_lines(tmp_path):
+  files = {
+    'plain.txt': '2, 2, 18\n0 0\n',
+    'solution.txt': '  inputs: [2, 2, 18, 0, 0]\n  frames: 4\n',
+    'route.txt': 'frames: 5 (per room: [3, 2])\ninputs: [2, 2, 18, 0, 0]\n'
+  }
+  for name, text in files.items():
+    (tmp_path / name).write_text(text)
+    assert read_inputs(tmp_path / name) == [2, 2, 18, 0, 0]
@@ -0,0 +1,56 @@
+from Searcheline import Searcheline
+import CelesteUtils as utils
+
+actions = [0, 1, 2, 4, 8, 16, 17, 18, 20, 32, 33, 34, 36, 37, 38, 40, 41, 42]
+
+# places maddy every step px (with and without a dash) and tries every input for one frame, checking that
+# the exit distances never drop by more than the frames the transition took (so they never overestimate the frames to exit)
+def check_exit_distances(level_id, step=4):
+  s = Searcheline()
+  p8, g = s.p8, s.p8.game
+  utils.load_room(p8, level_id)
+  utils.skip_player_spawn(p8)
+  room = g.save_state()
+  checked = 0
+  for y in range(0, 121, step):
+    for x in range(0, 121, step):
+      for djump in (0, 1):
+        g.load_state(room)
+        utils.place_maddy(p8, x, y, djump=djump)
+        if g.get_player().is_solid(0, 0):
+          continue
+        start = g.save_state()
+        h = s.exit_distances(g.objects).frames_to_exit(g.get_player())
+        for a in actions:
+          g.load_state(start)
+          p8.set_btn_state(a)
+          p8.step()
+          frames = 1
+          while g.freeze:
+            p8.step()
+            frames += 1
+          if g.level_index() != level_id:
+            next_h = 0
+          elif type(g.get_player()) == g.player:
+            next_h = s.exit_distances(g.objects).frames_to_exit(g.get_player())
+          else:
+            continue
+          assert h <= frames + next_h, f'level {level_id}, maddy at ({x}, {y}), djump {djump}, input {a}: h {h} > {frames} + {next_h}'
+          checked += 1
+  return checked
+
+def test_exit_distances_without_springs():
+  assert check_exit_distances(3) > 0
+
+def test_exit_distances_with_springs():
+  # springs launch maddy up to 8 px in one frame
+  assert check_exit_distances(24) > 0
+  assert check_exit_distances(28) > 0
+
+def test_problem_key_ignores_frame_counter():
+  s = Searcheline()
+  utils.load_room(s.p8, 0)
+  state = s.p8.game.save_state()
+  assert s.problem_key((state[0] + 1,) + state[1:]) == s.problem_key(state)
+  utils.skip_player_spawn(s.p8)
+  assert s.problem_key(s.p8.game.save_state()) != s.problem_key(state)